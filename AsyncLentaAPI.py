@@ -0,0 +1,239 @@
+import uuid
+import json
+import time
+import asyncio
+from typing import Optional, Callable, AsyncIterator
+
+import aiohttp
+
+from ratelimit import AdaptiveRateLimiter, get_default_rate_limiter
+from catalog_item import parse_catalog_page
+from metrics import RequestMetrics, get_default_metrics
+from LentaAPI import (LentaAPI, build_headers, build_catalog_items_payload, generate_qrator_token, get_localtime,
+                      truncate_body, logger)
+
+
+class AsyncLentaAPI:
+    """Асинхронный клиент API Ленты на aiohttp с теми же методами, что и `LentaAPI`.
+
+    Заголовки Qrator формируются на каждый запрос отдельно, поэтому один клиент
+    можно использовать из множества одновременных задач.
+    """
+    LENTOCHKA_URL = LentaAPI.LENTOCHKA_URL
+    API_LENTA_URL = LentaAPI.API_LENTA_URL
+
+    def __init__(self, app_version="6.25.2", client_version="android_14_6.25.2", marketing_partner_key="mp402-8a74f99040079ea25d64d14b5212b0e3",
+                 max_connections: int = 20, connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 session: Optional[aiohttp.ClientSession] = None, rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 max_throttle_retries: int = 3, debug: bool = False,
+                 lentochka_url: Optional[str] = None, api_url: Optional[str] = None,
+                 metrics: Optional[RequestMetrics] = None):
+        """Инициализация API-клиента
+
+        :param max_connections: размер пула соединений aiohttp
+        :param session: готовая `aiohttp.ClientSession`, если ее нужно разделить между клиентами
+        :param rate_limiter: ограничитель запросов; по умолчанию общий с синхронными клиентами
+        :param max_throttle_retries: сколько раз повторять запрос после 429
+        :param debug: сохранять полный ответ в `CatalogItem.raw` при разборе товаров
+        :param lentochka_url: адрес вместо `LENTOCHKA_URL` (например, локальный stub-сервер)
+        :param api_url: адрес вместо `API_LENTA_URL`
+        :param metrics: счетчики запросов; по умолчанию общие для процесса
+        """
+        if lentochka_url:
+            self.LENTOCHKA_URL = lentochka_url.rstrip("/")
+        if api_url:
+            self.API_LENTA_URL = api_url.rstrip("/")
+        self.debug = debug
+        self.metrics = metrics or get_default_metrics()
+        self.rate_limiter = rate_limiter or get_default_rate_limiter()
+        self.max_throttle_retries = max_throttle_retries
+        self.client_version = client_version
+        self.device_id = f"A-{uuid.uuid4()}"
+        self.request_id = uuid.uuid4().hex
+        self.marketing_partner_key = marketing_partner_key
+        self.app_version = app_version
+        self.session_token = None
+        self.headers = build_headers(self.client_version, self.app_version, self.device_id)
+
+        self._session = session
+        self._own_session = session is None
+        self._max_connections = max_connections
+        self._timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self._token_lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self._max_connections)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
+        return self._session
+
+    def _build_request_headers(self, url) -> dict:
+        headers = dict(self.headers)
+        headers['Qrator-Token'], headers['Timestamp'] = generate_qrator_token(url)
+        headers["LocalTime"] = get_localtime()
+        return {key: value for key, value in headers.items() if value is not None}
+
+    async def _request(self, method, url, loads: Callable = json.loads, **kwargs):
+        """Выполняет запрос и возвращает (status, json|None); `loads` разбирает тело ответа"""
+        session = self._get_session()
+        body = kwargs.get("data") or (json.dumps(kwargs["json"]) if kwargs.get("json") is not None else "")
+        for attempt in range(self.max_throttle_retries + 1):
+            if attempt:
+                self.metrics.record_retry(url)
+            await self.rate_limiter.acquire_async(url)
+            started = time.perf_counter()
+            async with session.request(method, url, headers=self._build_request_headers(url), **kwargs) as response:
+                # Как и в `LentaAPI`, в метрики идет длина распакованного тела в байтах
+                content = await response.read()
+                text = content.decode(response.get_encoding())
+                self.metrics.observe(url, response.status, time.perf_counter() - started, len(body), len(content))
+                self.rate_limiter.feedback(url, response.status, response.headers)
+                if response.status == 429 and attempt < self.max_throttle_retries:
+                    logger.warning(f"⚠️ 429 от {url} (попытка {attempt+1}/{self.max_throttle_retries + 1}), "
+                                   f"скорость снижена до {self.rate_limiter.current_rate(url):.2f} запр/с")
+                    continue
+                return self._parse_response(response, text, loads)
+
+    @staticmethod
+    def _parse_response(response: aiohttp.ClientResponse, text: str, loads: Callable = json.loads):
+        if response.status >= 400:
+            raise aiohttp.ClientResponseError(
+                response.request_info, response.history,
+                status=response.status, message=f"Ошибка API: {response.status}, {truncate_body(text)}", headers=response.headers
+            )
+        data = loads(text) if response.status == 200 and text else None
+        return response.status, data
+
+    async def get_session_token(self):
+        """Запрос к API для получения SessionToken"""
+        URL = f'{self.LENTOCHKA_URL}/api/rest/siteSettingsGet'
+        payload = {
+            "Head": {
+                "Method": "siteSettingsGet",
+                "RequestId": self.request_id,
+                "DeviceId": self.device_id,
+                "Client": self.client_version,
+                "MarketingPartnerKey": self.marketing_partner_key
+            }
+        }
+        self.headers.pop("SessionToken", None)
+        _, data = await self._request("GET", URL, params={"request": json.dumps(payload)})
+
+        self.session_token = (data or {}).get("Head", {}).get("SessionToken")
+        if not self.session_token:
+            raise ValueError("SessionToken не найден в ответе API")
+        self.headers["SessionToken"] = self.session_token
+        logger.info(f"✅ Новый SessionToken: {self.session_token}")
+        return self.session_token
+
+    async def _ensure_session_token(self):
+        """Получает SessionToken один раз, даже если его ждут несколько задач"""
+        if self.session_token:
+            return
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if not self.session_token:
+                await self.get_session_token()
+
+    async def get_catalog_items(self, category_id: int, limit: int = 200, offset: int = 0,
+                                filters: Optional[dict] = None, lean: bool = False):
+        """Получение одной страницы товаров из каталога по ID категории (формат как у `LentaAPI.get_catalog_items`)"""
+        await self._ensure_session_token()
+        URL = f'{self.API_LENTA_URL}/v1/catalog/items'
+        loads = (lambda text: parse_catalog_page(text, keep_raw=self.debug)) if lean else json.loads
+        _, data = await self._request("POST", URL, loads=loads,
+                                      data=json.dumps(build_catalog_items_payload(category_id, limit, offset, filters)))
+        return data
+
+    async def iter_catalog_items(self, category_id: int, page_size: int = 200,
+                                 stop: Optional[Callable] = None, filters: Optional[dict] = None,
+                                 lean: bool = False) -> AsyncIterator:
+        """Асинхронный аналог `LentaAPI.iter_catalog_items`: следующая страница
+        запрашивается отдельной задачей, пока обрабатывается текущая"""
+        offset = 0
+        page = await self.get_catalog_items(category_id, limit=page_size, offset=offset, filters=filters, lean=lean)
+        next_page = None
+        try:
+            while True:
+                items = (page or {}).get("items", [])
+                total = (page or {}).get("total", 0)
+                offset += len(items)
+
+                next_page = None
+                if items and offset < total:
+                    next_page = asyncio.create_task(self.get_catalog_items(category_id, page_size, offset, filters, lean))
+                del page
+
+                for item in items:
+                    yield item
+                    if stop is not None and stop(item):
+                        return
+
+                if next_page is None:
+                    return
+                page = await next_page
+        finally:
+            if next_page is not None and not next_page.done():
+                next_page.cancel()
+
+    async def get_stores(self):
+        """Получение списка всех доступных магазинов"""
+        await self._ensure_session_token()
+        URL = f'{self.API_LENTA_URL}/v1/stores/pickup/search'
+        _, data = await self._request("POST", URL, json={})
+        return data
+
+    async def set_delivery(self, store_id):
+        """Выбирает город с которым будем работать"""
+        await self._ensure_session_token()
+        URL = f'{self.LENTOCHKA_URL}/jrpc/deliveryModeSet'
+        payload = {
+            "jsonrpc": "2.0",
+            "method": "deliveryModeSet",
+            "id": 1738855566367,
+            "params": {
+                "type": "shop",
+                "storeId": store_id
+            }
+        }
+        await self._request("POST", URL, data=json.dumps(payload))
+
+    async def set_store(self, store_id):
+        await self._ensure_session_token()
+        URL = f'{self.LENTOCHKA_URL}/jrpc/pickupStoreSelectedSet'
+        payload = {
+            "jsonrpc": "2.0",
+            "method": "pickupStoreSelectedSet",
+            "id": 1738855567174,
+            "params": {
+                "storeId": store_id
+            }
+        }
+        _, data = await self._request("POST", URL, data=json.dumps(payload))
+        logger.info(f"🏪 Установлен магазин по адресу: {data['result']['addressFull']}")
+
+    async def get_categories(self) -> list:
+        """Получение списка категорий товаров (формат как у `LentaAPI.get_categories`)"""
+        await self._ensure_session_token()
+        URL = f'{self.API_LENTA_URL}/v1/catalog/categories'
+        _, data = await self._request("GET", URL)
+        return data["categories"]
+
+    async def get_catalog_item(self, item_id) -> dict:
+        """Получение подробностей про товар"""
+        await self._ensure_session_token()
+        URL = f'{self.API_LENTA_URL}/v1/catalog/items/{item_id}'
+        _, data = await self._request("GET", URL)
+        return data
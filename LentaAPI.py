@@ -2,9 +2,23 @@ import requests
 import uuid
 import json
 import time
+import queue
+import atexit
+import random
 import hashlib
 import logging
+import logging.config
+import logging.handlers
 from datetime import datetime, timezone
+from typing import Optional, Callable, Iterator
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from transport import HTTPTransport
+from ratelimit import AdaptiveRateLimiter, get_default_rate_limiter
+from catalog_item import parse_catalog_page
+from response_cache import ResponseCache
+from metrics import RequestMetrics, get_default_metrics
 
 def get_localtime():
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -14,9 +28,8 @@ def get_localtime():
 # ДОЛГО И МУЧИТЕЛЬНО НО ДОБЫЛ
 QRTR_SALT = "b4fad1ebab4532185b653330d593b472"
 
-def generate_qrator_token(url: str) -> tuple[str, str]:
-    """Генерирует Qrator-Token на основе URL и текущего времени."""
-    timestamp = str(int(time.time()))  # Аналог System.currentTimeMillis() / 1000
+def compute_qrator_token(url: str, timestamp: str) -> str:
+    """Qrator-Token для URL и заданного timestamp (им же сервер проверяет токен)"""
     url_base = url.split('?', 1)[0]   # Аналог substringBefore(url, '?')
 
     # Формируем строку для хэширования (соль + URL + timestamp)
@@ -24,9 +37,12 @@ def generate_qrator_token(url: str) -> tuple[str, str]:
     md5_hash = hashlib.md5(raw_string.encode('utf-8')).digest()
 
     # Преобразуем байты в строку в 16-ричном формате с ведущими нулями
-    token = ''.join(f"{byte:02x}" for byte in md5_hash)
-    
-    return token, timestamp
+    return ''.join(f"{byte:02x}" for byte in md5_hash)
+
+def generate_qrator_token(url: str) -> tuple[str, str]:
+    """Генерирует Qrator-Token на основе URL и текущего времени."""
+    timestamp = str(int(time.time()))  # Аналог System.currentTimeMillis() / 1000
+    return compute_qrator_token(url, timestamp), timestamp
 
 def setup_logging():
     logging_config = {
@@ -69,37 +85,150 @@ def setup_logging():
     }
     logging.config.dictConfig(logging_config)
 
+    # Файл и консоль обслуживает отдельный поток, поэтому запись в лог не задерживает запросы
+    report_logger = logging.getLogger("ReportLogger")
+    handlers = list(report_logger.handlers)
+    for handler in handlers:
+        report_logger.removeHandler(handler)
+    log_queue = queue.SimpleQueue()
+    report_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
 logger = logging.getLogger("ReportLogger")
 
+LOG_BODY_LIMIT = 500  # Сколько символов тела ответа попадает в лог
+
+
+def truncate_body(text: str, limit: int = LOG_BODY_LIMIT) -> str:
+    """Начало тела ответа для лога и сообщений об ошибках"""
+    return text if len(text) <= limit else f"{text[:limit]}... ({len(text)} символов)"
+
+
+def build_headers(client_version: str, app_version: str, device_id: str) -> dict:
+    """Базовые заголовки мобильного приложения"""
+    return {
+        "Accept-Encoding": "gzip",
+        "Client": client_version,
+        "App-Version": app_version,
+        "Connection": "Keep-Alive",
+        "DeviceId": device_id,
+        "baggage": "sentry-environment=production,sentry-public_key=f9ad84e90a2441998bd9ec0acb1a3dbe,sentry-release=com.icemobile.lenta.prod%406.25.2%2B2402",
+        "sentry-trace": "a4edef4706eb4781805db2a04de7231b-1fd9d2771e6a4e96",
+        "User-Agent": "okhttp/4.9.1",
+        "X-Platform": "omniapp",
+        "x-retail-brand": "lo"
+    }
+
+
+def build_catalog_items_payload(category_id: int, limit: int = 200, offset: int = 0, filters: Optional[dict] = None) -> dict:
+    """Тело запроса /v1/catalog/items
+
+    :param filters: фильтры в формате {"multicheckbox": [...], "checkbox": [...], "range": [...]},
+        недостающие группы заполняются пустыми списками
+    """
+    return {
+        "categoryId": category_id,
+        "filters": {
+            "multicheckbox": [],
+            "checkbox": [],
+            "range": [],
+            **(filters or {})
+        },
+        "sort": {
+            "type": "popular",
+            "order": "desc"
+        },
+        "limit": limit,
+        "offset": offset
+    }
+
 
 class LentaAPI:
     LENTOCHKA_URL = "https://lentochka.lenta.com"
     API_LENTA_URL = "https://api.lenta.com"
 
-    def __init__(self, app_version="6.25.2", client_version="android_14_6.25.2", marketing_partner_key="mp402-8a74f99040079ea25d64d14b5212b0e3"):
-        """Инициализация API-клиента"""
+    def __init__(self, app_version="6.25.2", client_version="android_14_6.25.2", marketing_partner_key="mp402-8a74f99040079ea25d64d14b5212b0e3",
+                 transport: Optional[HTTPTransport] = None, rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 max_throttle_retries: int = 3, debug: bool = False, response_cache: Optional[ResponseCache] = None,
+                 lentochka_url: Optional[str] = None, api_url: Optional[str] = None,
+                 metrics: Optional[RequestMetrics] = None, log_bodies: float = 0.0):
+        """Инициализация API-клиента
+
+        :param transport: HTTP-транспорт с пулом соединений. Можно передать один транспорт
+            нескольким клиентам, чтобы они делили keep-alive соединения
+        :param rate_limiter: ограничитель запросов; по умолчанию общий для всего процесса
+        :param max_throttle_retries: сколько раз повторять запрос после 429
+        :param debug: сохранять полный ответ в `CatalogItem.raw` при разборе товаров
+        :param response_cache: кэш ответов категорий, магазинов и подробностей товаров (по умолчанию выключен)
+        :param lentochka_url: адрес вместо `LENTOCHKA_URL` (например, локальный stub-сервер)
+        :param api_url: адрес вместо `API_LENTA_URL`
+        :param metrics: счетчики запросов; по умолчанию общие для процесса
+        :param log_bodies: доля ответов, тело которых (обрезанное) пишется в лог на уровне DEBUG
+        """
+        if lentochka_url:
+            self.LENTOCHKA_URL = lentochka_url.rstrip("/")
+        if api_url:
+            self.API_LENTA_URL = api_url.rstrip("/")
+        self.debug = debug
+        self.metrics = metrics or get_default_metrics()
+        self.log_bodies = log_bodies
+        self.rate_limit_client = None  # Если задан, пауза после 429 ставится только этому клиенту, а не всему хосту
+        self.response_cache = response_cache
+        self.delivery_store_id = None  # Магазин доставки и выбранный магазин — контекст для кэша
+        self.store_id = None
+        self.transport = transport or HTTPTransport()
+        self.rate_limiter = rate_limiter or get_default_rate_limiter()
+        self.max_throttle_retries = max_throttle_retries
         self.client_version = client_version
         self.device_id = f"A-{uuid.uuid4()}"  # Генерация уникального DeviceId
         self.request_id = uuid.uuid4().hex  # Уникальный RequestId
         self.marketing_partner_key = marketing_partner_key
         self.app_version = app_version
         self.session_token = None
-        self.headers = {
-            "Accept-Encoding": "gzip",
-            "Client": self.client_version,
-            "App-Version": self.app_version,
-            "Connection": "Keep-Alive",
-            "DeviceId": self.device_id,
-            "baggage": "sentry-environment=production,sentry-public_key=f9ad84e90a2441998bd9ec0acb1a3dbe,sentry-release=com.icemobile.lenta.prod%406.25.2%2B2402",
-            "sentry-trace": "a4edef4706eb4781805db2a04de7231b-1fd9d2771e6a4e96",
-            "User-Agent": "okhttp/4.9.1",
-            "X-Platform": "omniapp",
-            "x-retail-brand": "lo"
-        }
+        self.headers = build_headers(self.client_version, self.app_version, self.device_id)
     
-    def _update_qrator_token(self, url):
-        self.headers['Qrator-Token'], self.headers['Timestamp'] = generate_qrator_token(url)
-        self.headers["LocalTime"] = get_localtime()
+    def _build_request_headers(self, url) -> dict:
+        """Копия заголовков клиента со свежим Qrator-Token для конкретного URL.
+
+        Заголовки собираются на каждый запрос, поэтому клиентом можно
+        пользоваться из нескольких потоков (например, при подгрузке страниц)."""
+        headers = dict(self.headers)
+        headers['Qrator-Token'], headers['Timestamp'] = generate_qrator_token(url)
+        headers["LocalTime"] = get_localtime()
+        return headers
+
+    def _request(self, method, url, **kwargs) -> requests.Response:
+        """Отправляет запрос через транспорт с актуальными заголовками.
+
+        Каждый запрос проходит через ограничитель скорости, ответ сообщается ему
+        обратно. После 429 запрос повторяется, когда ограничитель разрешит
+        (с учетом `Retry-After`), но не больше `max_throttle_retries` раз.
+        Задержка, объем и код каждого ответа учитываются в `metrics`."""
+        body = kwargs.get("data") or (json.dumps(kwargs["json"]) if kwargs.get("json") is not None else "")
+        for attempt in range(self.max_throttle_retries + 1):
+            if attempt:
+                self.metrics.record_retry(url)
+            self.rate_limiter.acquire(url, self.rate_limit_client)
+            started = time.perf_counter()
+            response = self.transport.request(method, url, headers=self._build_request_headers(url), **kwargs)
+            self.metrics.observe(url, response.status_code, time.perf_counter() - started, len(body), len(response.content))
+            self.rate_limiter.feedback(url, response.status_code, response.headers, self.rate_limit_client)
+            if response.status_code != 429:
+                break
+            logger.warning(f"⚠️ 429 от {url} (попытка {attempt+1}/{self.max_throttle_retries + 1}), "
+                           f"скорость снижена до {self.rate_limiter.current_rate(url):.2f} запр/с")
+        return response
+
+    def _log_response(self, response: requests.Response):
+        """Код и размер ответа в лог; тело — обрезанное и только для доли `log_bodies` ответов"""
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        logger.debug("✅ Успешный ответ (%s) от %s, %d байт", response.status_code, response.url, len(response.content))
+        if self.log_bodies and random.random() < self.log_bodies:
+            logger.debug("📄 Тело ответа: %s", truncate_body(response.text))
 
     def get_session_token(self):
         """Запрос к API для получения SessionToken"""
@@ -117,11 +246,10 @@ class LentaAPI:
             "request": json.dumps(payload)
         }
 
-        self._update_qrator_token(URL)
         self.headers["SessionToken"] = None
 
-        response = requests.get(URL, headers=self.headers, params=params)
-        logger.info(f"📡 Отправка запроса на {URL} с параметрами: {json.dumps(payload, ensure_ascii=False)}")
+        response = self._request("GET", URL, params=params)
+        logger.debug("📡 Отправлен запрос на %s с параметрами: %s", URL, params["request"])
 
         if response.status_code == 200:
             data = response.json()
@@ -133,15 +261,30 @@ class LentaAPI:
             else:
                 raise ValueError("SessionToken не найден в ответе API")
         else:
-            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {response.text}")
+            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {truncate_body(response.text)}")
 
     def _ensure_session_token(self):
         """Проверяет, есть ли `SessionToken`, если нет – запрашивает его."""
         if not self.session_token:
             self.get_session_token()
 
-    def get_catalog_items(self, category_id: int):
-        """Получение товаров в наличии из каталога по ID категории
+    def _cached(self, endpoint: str, fetch: Callable, params=None, store_context: bool = True):
+        """Ответ из кэша или `fetch()` с сохранением в кэш.
+
+        :param store_context: ответ зависит от выбранного магазина"""
+        if self.response_cache is None:
+            return fetch()
+        context = f"{self.delivery_store_id}:{self.store_id}" if store_context else None
+        data = self.response_cache.get(endpoint, context, params)
+        if data is None:
+            data = fetch()
+            self.response_cache.set(endpoint, data, context, params)
+        return data
+
+    def get_catalog_items(self, category_id: int, limit: int = 200, offset: int = 0, filters: Optional[dict] = None,
+                          lean: bool = False):
+        """Получение одной страницы товаров из каталога по ID категории.
+        С `lean=True` возвращается {"items": [CatalogItem, ...], "total": ...}, иначе полный ответ
         формат ответа:
         {
             "categories": ...,
@@ -205,41 +348,75 @@ class LentaAPI:
         self._ensure_session_token()
 
         URL = f'{self.API_LENTA_URL}/v1/catalog/items'
-        payload = {
-            "categoryId": category_id,
-            "filters": {
-                "multicheckbox": [],
-                "checkbox": [],
-                "range": []
-            },
-            "sort": {
-                "type": "popular",
-                "order": "desc"
-            },
-            "limit": 200,
-            "offset": 0
-        }
+        payload = build_catalog_items_payload(category_id, limit, offset, filters)
         
-        self._update_qrator_token(URL)
-        response = requests.post(URL, headers=self.headers, data=json.dumps(payload))
+        response = self._request("POST", URL, data=json.dumps(payload))
         if response.ok:
-            logger.info(f"✅ Успешный ответ ({response.status_code}): {response.text}")
-            return response.json() if response.status_code == 200 else None
+            self._log_response(response)
+            if response.status_code != 200:
+                return None
+            return parse_catalog_page(response.content, keep_raw=self.debug) if lean else response.json()
         else:
-            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {response.text}")
+            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {truncate_body(response.text)}")
+
+    def iter_catalog_items(self, category_id: int, page_size: int = 200,
+                           stop: Optional[Callable] = None, prefetch: bool = True,
+                           filters: Optional[dict] = None, lean: bool = False) -> Iterator:
+        """Потоково перебирает все товары категории, листая `offset` до `total`.
+
+        Пока обрабатывается текущая страница, следующая загружается в фоновом потоке.
+        Перебор заканчивается, когда товары закончились или `stop(item)` вернул True
+        для последнего выданного товара.
+
+        Магазин выбирается на стороне сервера, поэтому менять его (`set_store`)
+        до окончания перебора нельзя. С `lean=True` выдаются `CatalogItem`.
+        """
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            offset = 0
+            page = self.get_catalog_items(category_id, limit=page_size, offset=offset, filters=filters, lean=lean)
+            while True:
+                items = (page or {}).get("items", [])
+                total = (page or {}).get("total", 0)
+                offset += len(items)
+
+                next_page = None
+                if items and offset < total:
+                    if executor:
+                        next_page = executor.submit(self.get_catalog_items, category_id, page_size, offset, filters, lean)
+                    else:
+                        next_page = partial(self.get_catalog_items, category_id, page_size, offset, filters, lean)
+                del page
+
+                for item in items:
+                    yield item
+                    if stop is not None and stop(item):
+                        if isinstance(next_page, Future):
+                            next_page.cancel()
+                        return
+
+                if next_page is None:
+                    return
+                page = next_page.result() if isinstance(next_page, Future) else next_page()
+        finally:
+            if executor:
+                # Дожидаемся фонового запроса, чтобы он не пересекся со сменой магазина
+                executor.shutdown(wait=True)
 
     def get_stores(self):
         """Получение списка всех доступных магазинов"""
+        return self._cached("stores", self._fetch_stores, store_context=False)
+
+    def _fetch_stores(self):
         self._ensure_session_token()
 
         URL = f'{self.API_LENTA_URL}/v1/stores/pickup/search'
-        self._update_qrator_token(URL)
-        response = requests.post(URL, headers=self.headers, json={})
+        response = self._request("POST", URL, json={})
         if response.ok:
-            logger.info(f"✅ Успешный ответ ({response.status_code}): {response.text}")
+            self._log_response(response)
             return response.json() if response.status_code == 200 else None
         else:
-            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {response.text}")
+            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {truncate_body(response.text)}")
     
     def set_delivery(self, store_id):
         """Выбирает город с которым будем работать"""
@@ -256,12 +433,12 @@ class LentaAPI:
                 "storeId": store_id
             }
         }
-        self._update_qrator_token(URL)
-        response = requests.post(URL, headers=self.headers, data=json.dumps(payload))
+        response = self._request("POST", URL, data=json.dumps(payload))
         if response.ok:
-            logger.info(f"✅ Успешный ответ ({response.status_code}): {response.text}")
+            self._log_response(response)
+            self.delivery_store_id = store_id
         else:
-            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {response.text}")
+            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {truncate_body(response.text)}")
 
     def set_store(self, store_id):
         self._ensure_session_token()
@@ -276,13 +453,13 @@ class LentaAPI:
                 "storeId": store_id
             }
         }
-        self._update_qrator_token(URL)
-        response = requests.post(URL, headers=self.headers, data=json.dumps(payload))
+        response = self._request("POST", URL, data=json.dumps(payload))
         if response.ok:
-            logger.info(f"✅ Успешный ответ ({response.status_code}): {response.text}")
+            self._log_response(response)
             logger.info(f"🏪 Установлен магазин по адресу: {response.json()['result']['addressFull']}")
+            self.store_id = store_id
         else:
-            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {response.text}")
+            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {truncate_body(response.text)}")
 
     def get_categories(self) -> dict:
         """Получение списка категорий товаров в формате 
@@ -300,27 +477,31 @@ class LentaAPI:
             "parentName": "",
             "slug": "alkogol"
         }"""
+        return self._cached("categories", self._fetch_categories)
+
+    def _fetch_categories(self) -> list:
         self._ensure_session_token()
 
         URL = f'{self.API_LENTA_URL}/v1/catalog/categories'
-        self._update_qrator_token(URL)
-        response = requests.get(URL, headers=self.headers)
+        response = self._request("GET", URL)
         if response.status_code == 200:
             return response.json()["categories"]
         else:
-            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {response.text}")
+            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {truncate_body(response.text)}")
 
     def get_catalog_item(self, item_id) -> dict:
         """Получение подробностей про товар"""
+        return self._cached("item", lambda: self._fetch_catalog_item(item_id), params=item_id)
+
+    def _fetch_catalog_item(self, item_id) -> dict:
         self._ensure_session_token()
 
         URL = f'{self.API_LENTA_URL}/v1/catalog/items/{item_id}'
-        self._update_qrator_token(URL)
-        response = requests.get(URL, headers=self.headers)
+        response = self._request("GET", URL)
         if response.status_code == 200:
             return response.json()
         else:
-            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {response.text}", response=response)
+            raise requests.HTTPError(f"Ошибка API: {response.status_code}, {truncate_body(response.text)}", response=response)
 
 if __name__ == "__main__":
     setup_logging()
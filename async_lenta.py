@@ -0,0 +1,155 @@
+import random
+import asyncio
+from typing import Optional
+
+import aiohttp
+
+from AsyncLentaAPI import AsyncLentaAPI
+from brand_cache import BrandCache
+from lenta import LentaParser, extract_brand, is_available, to_product
+from store_directory import StoreDirectory
+from logger import get_logger
+logger = get_logger()
+
+
+class AsyncLentaParser:
+    """Асинхронный драйвер парсера: бренды товаров запрашиваются параллельно.
+
+    Число одновременных запросов ограничено `max_concurrency`, а общий темп задает
+    адаптивный ограничитель скорости клиента, поэтому время обогащения определяется
+    лимитом сервера, а не суммой задержек всех запросов.
+    """
+
+    TARGET_CITIES = LentaParser.TARGET_CITIES
+
+    def __init__(self, api: AsyncLentaAPI, max_concurrency: int = 8,
+                 brand_cache: Optional[BrandCache] = None, store_directory: Optional[StoreDirectory] = None):
+        self.api: AsyncLentaAPI = api
+        self.store_directory = store_directory or StoreDirectory()
+        self.brand_cache: Optional[BrandCache] = brand_cache
+        self.city_stores = {"Москва": [], "Санкт-Петербург": []}
+        self.store_apis: dict = {}
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _get_target_stores(self):
+        """Фильтрует магазины только в Москве и Санкт-Петербурге"""
+        index = self.store_directory.load_cached() or self.store_directory.save(await self.api.get_stores())
+        self.city_stores = index.select(self.TARGET_CITIES, market_type="HM")
+        if not all(self.city_stores.values()):
+            raise ValueError("Нет доступных магазинов в Москве и Санкт-Петербурге")
+
+    async def _get_store_api(self, store_id) -> AsyncLentaAPI:
+        """Клиент со своей сессией, в которой магазин `store_id` выбран один раз"""
+        if store_id not in self.store_apis:
+            store_api = AsyncLentaAPI(session=self.api._get_session(), rate_limiter=self.api.rate_limiter,
+                                      lentochka_url=self.api.LENTOCHKA_URL, api_url=self.api.API_LENTA_URL)
+            await store_api.set_delivery(store_id)
+            await store_api.set_store(store_id)
+            self.store_apis[store_id] = store_api
+        return self.store_apis[store_id]
+
+    async def _get_brand_of_product(self, product_id, max_retries=7):
+        """Получает бренд товара по его ID с повторными попытками при 429"""
+        for attempt in range(max_retries):
+            async with self.semaphore:
+                try:
+                    data = await self.api.get_catalog_item(product_id)
+                    brand = extract_brand(data)
+                    if self.brand_cache is not None:
+                        self.brand_cache.set(product_id, brand, data.get('attributes'))
+                    return brand
+                except aiohttp.ClientResponseError as e:
+                    if e.status != 429:
+                        raise
+                    logger.error(f"❌ Ошибка HTTP: {e.status} - {e.message}")
+            # Паузу после 429 выдерживает ограничитель скорости при следующем запросе
+            logger.warning(f"⚠️ Превышен лимит запросов для {product_id} (попытка {attempt+1}/{max_retries})")
+
+        raise TimeoutError(f"❌ Не удалось получить бренд товара {product_id} за {max_retries} попыток.")
+
+    async def _enrich_with_brands(self, products: list):
+        """Добавляет бренды ко всем товарам одновременно, пропуская найденные в кэше"""
+        if self.brand_cache is not None:
+            cached, _ = self.brand_cache.get_many([product["id"] for product in products])
+            for product in products:
+                if product["id"] in cached:
+                    product["brand"] = cached[product["id"]]
+            print(f"💾 Бренды из кэша: {len(cached)}")
+            products = [product for product in products if "brand" not in product]
+        done = 0
+
+        async def enrich(product):
+            nonlocal done
+            product["brand"] = await self._get_brand_of_product(product["id"])
+            done += 1
+            print(f"🛒 {product['name']} ({product['id']}) добавлен в список ({done}/{len(products)})")
+
+        await asyncio.gather(*(enrich(product) for product in products))
+
+    async def _find_common_products(self, moscow_api: AsyncLentaAPI, piter_api: AsyncLentaAPI,
+                                    moscow_category: int, piter_category: int) -> list:
+        """Общие товары в наличии в категории (не больше `PRODUCTS_LIMIT`), как `LentaParser._find_common_products`:
+        каталог питера собирается отдельной задачей, а мск читается потоково до нужного числа общих товаров"""
+        async def collect_piter_ids() -> set:
+            return {item.id async for item in piter_api.iter_catalog_items(piter_category, lean=True) if is_available(item)}
+
+        piter_ids_task = asyncio.create_task(collect_piter_ids())
+        common_products = []
+        try:
+            async for item in moscow_api.iter_catalog_items(
+                moscow_category,
+                stop=lambda _: len(common_products) >= LentaParser.PRODUCTS_LIMIT,
+                lean=True
+            ):
+                if is_available(item) and item.id in await piter_ids_task:
+                    common_products.append(to_product(item))
+        finally:
+            if not piter_ids_task.done():
+                piter_ids_task.cancel()
+        return common_products
+
+    async def run(self):
+        """Основная логика парсинга, аналог `LentaParser.run`"""
+        await self._get_target_stores()
+
+        moscow_store, moscow_store_location = random.choice(self.city_stores["Москва"])
+        piter_store, piter_store_location = random.choice(self.city_stores["Санкт-Петербург"])
+        print(f"📍 Москва, магазин ID: {moscow_store}, адрес: {moscow_store_location}")
+        print(f"📍 Питер, магазин ID: {piter_store}, адрес: {piter_store_location}")
+
+        moscow_api, piter_api = await asyncio.gather(self._get_store_api(moscow_store), self._get_store_api(piter_store))
+        moscow_categories, piter_categories = await asyncio.gather(moscow_api.get_categories(), piter_api.get_categories())
+        moscow_categories_level_1 = {x['slug']: x['id'] for x in moscow_categories if x['level'] == 1}
+        piter_categories_level_1 = {x['slug']: x['id'] for x in piter_categories if x['level'] == 1}
+
+        common_categories = set(moscow_categories_level_1) & set(piter_categories_level_1)
+        for category_slug in common_categories:
+            print(f"\n🔍 Поиск общих товаров в категории {category_slug}")
+
+            common_products = await self._find_common_products(
+                moscow_api, piter_api, moscow_categories_level_1[category_slug], piter_categories_level_1[category_slug]
+            )
+            if len(common_products) < 100:
+                print(f"❌ Нехватка общих товаров в категории {category_slug}")
+                continue
+
+            print(f"✅ Найдено {len(common_products)} общих товаров в категории {category_slug}")
+            await self._enrich_with_brands(common_products)
+            return common_products
+
+        print("❌ Не найдено общих категорий, где больше 100 общих товаров в наличии в Москве и Питере")
+        return []
+
+    save_results = LentaParser.save_results
+
+
+async def main():
+    async with AsyncLentaAPI() as api:
+        parser = AsyncLentaParser(api, brand_cache=BrandCache())
+        results = await parser.run()
+        parser.save_results(results)
+        logger.info(f"🚦 Скорость запросов по хостам: {api.rate_limiter.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,302 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import resource
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+from functools import partial
+from typing import Optional
+from urllib.parse import urlsplit
+
+from LentaAPI import LentaAPI
+from lenta import LentaParser, prefer_stores
+from brand_cache import BrandCache
+from identity import IdentityPool
+from pipeline import StageProfiler
+from ratelimit import AdaptiveRateLimiter
+from stub_server import StubLentaServer
+from transport import HTTPTransport
+from replay import RecordingTransport, ReplayTransport
+from logger import get_logger
+logger = get_logger()
+
+CITIES = ("Москва", "Санкт-Петербург", "Казань", "Екатеринбург", "Новосибирск", "Самара", "Нижний Новгород")
+
+
+def _json(data) -> tuple:
+    return 200, json.dumps(data, ensure_ascii=False), {}
+
+
+class SyntheticLenta:
+    """Генератор ответов API Ленты для `StubLentaServer` нужного масштаба.
+
+    Магазины, категории и товары не хранятся, а вычисляются по id, поэтому
+    сервер на десятки тысяч товаров не занимает память. Наличие товара зависит
+    от магазина (около 10% нет в наличии), бренд — от id товара. Выбранный
+    магазин запоминается по SessionToken, как на настоящем сервере.
+    """
+
+    def __init__(self, stores: int = 2000, categories: int = 20, products: int = 20000, brands: int = 25):
+        """
+        :param brands: число брендов в каждой категории
+        """
+        self.stores = stores
+        self.categories = categories
+        self.per_category = max(products // categories, 1)
+        self.brands = brands
+        self._selected_store: dict = {}  # SessionToken -> магазин
+
+    def _store(self, store_id: int) -> dict:
+        # Первые два магазина — гипермаркеты в Москве и Питере, чтобы парсеру было из чего выбрать
+        city = CITIES[(store_id - 1) % len(CITIES)]
+        return {
+            "id": store_id,
+            "addressFull": f"г. {city}, ул. Синтетическая, {store_id}",
+            "marketType": "HM" if store_id <= 2 or store_id % 3 == 0 else "MM",
+            "lat": 43 + (store_id * 7919 % 1500) / 100,
+            "long": 30 + (store_id * 104729 % 10000) / 100,
+        }
+
+    def _category_products(self, category_id: int) -> range:
+        start = (category_id - 1000) * self.per_category + 1
+        return range(start, start + self.per_category)
+
+    def _brand(self, product_id: int) -> int:
+        return product_id % self.brands
+
+    def _item(self, product_id: int, store_id: int) -> dict:
+        price = 1000 + product_id * 7919 % 50000
+        return {
+            "id": product_id,
+            "name": f"Товар {product_id}",
+            "count": (product_id * 31 + store_id * 17) % 10,
+            "features": {"isBlockedForSale": False},
+            "prices": {"cost": price - price // 10 * (product_id % 2), "costRegular": price},
+            "storeId": store_id,
+        }
+
+    def _catalog_items(self, store_id: int, payload: dict) -> tuple:
+        products = self._category_products(payload["categoryId"])
+        for facet in payload.get("filters", {}).get("multicheckbox", []):
+            if facet.get("key") == "brand" and facet.get("values"):
+                brand = facet["values"][0]
+                products = products[(brand - products.start) % self.brands::self.brands]
+        offset, limit = payload.get("offset", 0), payload.get("limit", 200)
+        return _json({
+            "items": [self._item(product_id, store_id) for product_id in products[offset:offset + limit]],
+            "total": len(products),
+            "filters": {"multicheckbox": [{
+                "key": "brand", "name": "Бренд",
+                "values": [{"value": brand, "name": f"Бренд {brand}"} for brand in range(self.brands)],
+            }]},
+        })
+
+    def __call__(self, method: str, url: str, headers: dict, body: bytes) -> Optional[tuple]:
+        path = urlsplit(url).path
+        store_id = self._selected_store.get(headers.get("SessionToken"), 0)
+        payload = json.loads(body) if body else {}
+
+        if path == "/api/rest/siteSettingsGet":
+            return _json({"Head": {"SessionToken": uuid.uuid4().hex}})
+        if path == "/v1/stores/pickup/search":
+            return _json({"items": [self._store(i) for i in range(1, self.stores + 1)]})
+        if path == "/jrpc/deliveryModeSet":
+            return _json({"jsonrpc": "2.0", "result": {}})
+        if path == "/jrpc/pickupStoreSelectedSet":
+            store = self._store(payload["params"]["storeId"])
+            self._selected_store[headers.get("SessionToken")] = store["id"]
+            return _json({"jsonrpc": "2.0", "result": {"addressFull": store["addressFull"]}})
+        if path == "/v1/catalog/categories":
+            return _json({"categories": [
+                {"id": 1000 + c, "level": 1, "parentId": 0, "hasChildren": False,
+                 "name": f"Категория {c}", "slug": f"category-{c}"}
+                for c in range(self.categories)
+            ]})
+        if path == "/v1/catalog/items" and method == "POST":
+            return self._catalog_items(store_id, payload)
+        if path.startswith("/v1/catalog/items/"):
+            product_id = int(path.rsplit("/", 1)[1])
+            brand = f"Бренд {self._brand(product_id)}"
+            return _json({"id": product_id, "name": f"Товар {product_id}",
+                          "attributes": [{"alias": "brand", "name": "Бренд", "slug": "brand", "value": brand}]})
+        return None
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(stores: int = 2000, categories: int = 20, products: int = 20000, brands: int = 25,
+                  products_limit: int = LentaParser.PRODUCTS_LIMIT, brand_mode: str = "items",
+                  latency: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 0.2,
+                  initial_rate: float = 50.0, max_rate: float = 500.0, throttle_cooldown: float = 1.0,
+                  search_workers: int = 2, enrich_workers: int = 4, verbose: bool = False) -> dict:
+    """Один прогон `LentaParser` против синтетического сервера, возвращает метрики"""
+    synthetic = SyntheticLenta(stores, categories, products, brands)
+    server = StubLentaServer(synthetic, latency=latency, throttle_rate=throttle_rate, retry_after=retry_after, seed=0)
+    level = logger.level
+    if not verbose:
+        logger.setLevel(logging.ERROR)
+    cwd = os.getcwd()
+    profiler = StageProfiler()
+    with server, tempfile.TemporaryDirectory() as workdir:
+        # Файлы прогона (поток, чекпоинт, кэши) пишутся во временную папку
+        os.chdir(workdir)
+        try:
+            rate_limiter = AdaptiveRateLimiter(initial_rate=initial_rate, max_rate=max_rate)
+            api = LentaAPI(rate_limiter=rate_limiter, lentochka_url=server.url, api_url=server.url)
+            identities = IdentityPool(
+                transport=api.transport, rate_limiter=rate_limiter, throttle_cooldown=throttle_cooldown,
+                api_factory=partial(LentaAPI, lentochka_url=server.url, api_url=server.url)
+            )
+            parser = LentaParser(api, brand_cache=BrandCache(os.path.join(workdir, "brands.sqlite3")),
+                                 brand_mode=brand_mode, identities=identities, profiler=profiler,
+                                 search_workers=search_workers, enrich_workers=enrich_workers)
+            parser.PRODUCTS_LIMIT = products_limit
+
+            started = time.perf_counter()
+            output = io.StringIO() if not verbose else sys.stdout
+            with redirect_stdout(output):
+                parser.run()
+                results = parser.finalize()
+            wall = time.perf_counter() - started
+            identities.close()
+            parser.store_sessions.close()
+            parser.brand_cache.close()
+            transport_stats = api.transport.stats()
+        finally:
+            os.chdir(cwd)
+            logger.setLevel(level)
+
+    server_stats = server.stats()
+    return {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "timestamp": int(time.time()),
+        "config": {
+            "stores": stores, "categories": categories, "products": products, "brands": brands,
+            "products_limit": products_limit, "brand_mode": brand_mode, "latency": latency,
+            "throttle_rate": throttle_rate, "initial_rate": initial_rate, "max_rate": max_rate,
+            "search_workers": search_workers, "enrich_workers": enrich_workers,
+        },
+        "wall_seconds": round(wall, 3),
+        "requests": server_stats["requests"],
+        "requests_per_second": round(server_stats["requests"] / wall, 1) if wall else 0.0,
+        "enriched_products": len(results),
+        "enriched_products_per_second": round(len(results) / profiler.seconds("enrich"), 1) if profiler.seconds("enrich") else 0.0,
+        "throttled_429": server_stats["throttled"],
+        "rejected_qrator": server_stats["rejected"],
+        "connections_opened": transport_stats["connections_opened"],
+        # Сервер работает в том же процессе, поэтому его память тоже входит в пик
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        # Время этапов конвейера с несколькими потоками — сумма по потокам, wait_seconds — ожидание в очередях
+        "stages": profiler.stats(),
+    }
+
+
+def _parse_once(transport, url: str, store_choice=None, brand_mode: str = "items") -> tuple:
+    """Прогон парсера через `transport` в текущей папке: (выбранные магазины, итоговые товары)"""
+    rate_limiter = AdaptiveRateLimiter(initial_rate=1000, max_rate=1000)
+    api = LentaAPI(transport=transport, rate_limiter=rate_limiter, lentochka_url=url, api_url=url)
+    identities = IdentityPool(transport=transport, rate_limiter=rate_limiter,
+                              api_factory=partial(LentaAPI, lentochka_url=url, api_url=url))
+    options = {"store_choice": store_choice} if store_choice else {}
+    parser = LentaParser(api, brand_cache=BrandCache(":memory:"), brand_mode=brand_mode, identities=identities, **options)
+    try:
+        with redirect_stdout(io.StringIO()):
+            parser.run()
+            stores = parser.checkpoint.get("stores")
+            results = parser.finalize()
+    finally:
+        identities.close()
+        parser.store_sessions.close()
+        parser.brand_cache.close()
+    return stores, results
+
+
+def run_replay_check(stores: int = 200, categories: int = 3, products: int = 1500, brand_mode: str = "items") -> dict:
+    """Записывает прогон против синтетического сервера в кассету и воспроизводит его через
+    `ReplayTransport` без сервера. Воспроизведение должно выбрать те же магазины и
+    вернуть те же товары"""
+    level = logger.level
+    logger.setLevel(logging.ERROR)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            cassette = os.path.join(workdir, "cassette.jsonl")
+            with StubLentaServer(SyntheticLenta(stores, categories, products), seed=0) as server:
+                url = server.url
+                recorded_stores, recorded = _parse_once(RecordingTransport(cassette, HTTPTransport()), url,
+                                                        brand_mode=brand_mode)
+            for name in os.listdir(workdir):
+                if name != "cassette.jsonl":
+                    os.remove(os.path.join(workdir, name))
+
+            # Сервер остановлен: все ответы идут из кассеты
+            replay = ReplayTransport(cassette)
+            replayed_stores, replayed = _parse_once(replay, url, prefer_stores(replay.cassette.selected_stores),
+                                                    brand_mode=brand_mode)
+        finally:
+            os.chdir(cwd)
+            logger.setLevel(level)
+
+    return {
+        "ok": recorded_stores == replayed_stores and recorded == replayed and not replay.cassette.misses,
+        "recorded_stores": recorded_stores,
+        "replayed_stores": replayed_stores,
+        "recorded_products": len(recorded),
+        "replayed_products": len(replayed),
+        "same_products": recorded == replayed,
+        "cassette_entries": len(replay.cassette),
+        "replay_misses": replay.cassette.misses,
+    }
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк LentaParser на синтетическом сервере")
+    arg_parser.add_argument("--stores", type=int, default=2000)
+    arg_parser.add_argument("--categories", type=int, default=20)
+    arg_parser.add_argument("--products", type=int, default=20000)
+    arg_parser.add_argument("--brands", type=int, default=25, help="брендов в категории")
+    arg_parser.add_argument("--products-limit", type=int, default=LentaParser.PRODUCTS_LIMIT, help="сколько общих товаров искать (не меньше 100)")
+    arg_parser.add_argument("--brand-mode", choices=("items", "facets"), default="items")
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа сервера, с")
+    arg_parser.add_argument("--throttle-rate", type=float, default=0.0, help="доля ответов 429")
+    arg_parser.add_argument("--initial-rate", type=float, default=50.0, help="начальная скорость ограничителя, запр/с")
+    arg_parser.add_argument("--max-rate", type=float, default=500.0)
+    arg_parser.add_argument("--search-workers", type=int, default=2, help="сколько категорий проверять одновременно")
+    arg_parser.add_argument("--enrich-workers", type=int, default=4, help="сколько товаров обогащать одновременно")
+    arg_parser.add_argument("--output", default="bench_results.json", help="куда дописать результат (JSON Lines)")
+    arg_parser.add_argument("--verbose", action="store_true")
+    arg_parser.add_argument("--replay-check", action="store_true",
+                            help="записать прогон в кассету, воспроизвести без сервера и сравнить результаты")
+    args = arg_parser.parse_args()
+
+    if args.replay_check:
+        check = run_replay_check(brand_mode=args.brand_mode)
+        print(json.dumps(check, ensure_ascii=False, indent=4))
+        print("✅ Воспроизведение совпало с записью" if check["ok"] else "❌ Воспроизведение разошлось с записью")
+        sys.exit(0 if check["ok"] else 1)
+
+    result = run_benchmark(
+        stores=args.stores, categories=args.categories, products=args.products, brands=args.brands,
+        products_limit=args.products_limit, brand_mode=args.brand_mode, latency=args.latency,
+        throttle_rate=args.throttle_rate, initial_rate=args.initial_rate, max_rate=args.max_rate,
+        search_workers=args.search_workers, enrich_workers=args.enrich_workers, verbose=args.verbose,
+    )
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    print(json.dumps(result, ensure_ascii=False, indent=4))
+    print(f"✅ Результат дописан в {args.output}")
@@ -0,0 +1,125 @@
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+
+class BrandCache:
+    """Постоянный кэш брендов товаров: id товара -> бренд (и, при желании, атрибуты).
+
+    Данные хранятся в SQLite на диске, поверх него — LRU-слой в памяти.
+    Записи старше `ttl` секунд считаются устаревшими и запрашиваются заново.
+    """
+
+    def __init__(self, path: str = "lenta_brands.sqlite3", ttl: float = 30 * 24 * 3600, memory_size: int = 10_000):
+        """
+        :param path: путь к файлу базы (":memory:" — без сохранения на диск)
+        :param ttl: время жизни записи в секундах
+        :param memory_size: максимальное число записей в памяти
+        """
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self._memory: OrderedDict = OrderedDict()  # product_id -> (brand, updated_at)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS brands ("
+            " product_id INTEGER PRIMARY KEY,"
+            " brand TEXT NOT NULL,"
+            " attributes TEXT,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def _is_fresh(self, updated_at: float, now: float) -> bool:
+        return now - updated_at < self.ttl
+
+    def _remember(self, product_id: int, brand: str, updated_at: float):
+        self._memory[product_id] = (brand, updated_at)
+        self._memory.move_to_end(product_id)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, product_id: int) -> Optional[str]:
+        """Бренд товара или None, если его нет в кэше или запись устарела"""
+        found, _ = self.get_many([product_id])
+        return found.get(product_id)
+
+    def get_many(self, product_ids: Iterable[int]) -> tuple[dict, list]:
+        """Массовый поиск: возвращает (найденные {id: бренд}, список id, которые нужно запросить)"""
+        now = time.time()
+        found, misses = {}, []
+        with self._lock:
+            for product_id in product_ids:
+                cached = self._memory.get(product_id)
+                if cached and self._is_fresh(cached[1], now):
+                    self._memory.move_to_end(product_id)
+                    found[product_id] = cached[0]
+                else:
+                    misses.append(product_id)
+
+            for chunk_start in range(0, len(misses), 500):
+                chunk = misses[chunk_start:chunk_start + 500]
+                rows = self._db.execute(
+                    f"SELECT product_id, brand, updated_at FROM brands WHERE product_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                for product_id, brand, updated_at in rows:
+                    if self._is_fresh(updated_at, now):
+                        self._remember(product_id, brand, updated_at)
+                        found[product_id] = brand
+
+        return found, [product_id for product_id in misses if product_id not in found]
+
+    def get_attributes(self, product_id: int) -> Optional[list]:
+        """Сохраненные атрибуты товара, если они записывались"""
+        with self._lock:
+            row = self._db.execute("SELECT attributes, updated_at FROM brands WHERE product_id = ?", (product_id,)).fetchone()
+        if row and row[0] and self._is_fresh(row[1], time.time()):
+            return json.loads(row[0])
+        return None
+
+    def set(self, product_id: int, brand: str, attributes: Optional[list] = None):
+        """Сохраняет бренд товара (и атрибуты, если переданы)"""
+        self.set_many({product_id: brand}, {product_id: attributes} if attributes is not None else None)
+
+    def set_many(self, brands: dict, attributes: Optional[dict] = None):
+        """Сохраняет пачку брендов {id: бренд} одной транзакцией.
+        Уже сохраненные атрибуты не затираются, если новых для товара не передали"""
+        now = time.time()
+        attributes = attributes or {}
+        rows = [
+            (product_id, brand,
+             json.dumps(attributes[product_id], ensure_ascii=False) if product_id in attributes else None,
+             now)
+            for product_id, brand in brands.items()
+        ]
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO brands (product_id, brand, attributes, updated_at) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT(product_id) DO UPDATE SET brand = excluded.brand, updated_at = excluded.updated_at,"
+                    " attributes = COALESCE(excluded.attributes, brands.attributes)",
+                    rows
+                )
+            for product_id, brand in brands.items():
+                self._remember(product_id, brand, now)
+
+    def purge_expired(self) -> int:
+        """Удаляет устаревшие записи с диска, возвращает их количество"""
+        with self._lock:
+            with self._db:
+                cursor = self._db.execute("DELETE FROM brands WHERE updated_at < ?", (time.time() - self.ttl,))
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,147 @@
+from typing import Iterable, Optional
+
+from LentaAPI import LentaAPI
+from brand_cache import BrandCache
+from logger import get_logger
+logger = get_logger()
+
+BRAND_FILTER_KEYS = {"brand", "brands"}  # Ключи фасета бренда в блоке filters.multicheckbox
+BRAND_FILTER_NAME = "Бренд"
+NO_BRAND = "Без бренда"
+VERIFY_BRANDS = 3  # Сколько брендов пробовать, чтобы проверить, что фильтр применяется
+
+
+def extract_brand(item_details: dict) -> str:
+    """Достает бренд из атрибутов ответа /v1/catalog/items/{id}"""
+    for attribute in item_details.get('attributes', []):
+        if attribute['alias'] == 'brand' or attribute['name'] == 'Бренд' or attribute['slug'] == 'brand':
+            return attribute['value']
+    return NO_BRAND
+
+
+def find_brand_facet(filters: dict) -> Optional[dict]:
+    """Находит фасет бренда в блоке `filters` ответа /v1/catalog/items"""
+    for facet in (filters or {}).get("multicheckbox", []):
+        keys = {facet.get("key"), facet.get("alias"), facet.get("slug")}
+        if keys & BRAND_FILTER_KEYS or facet.get("name") == BRAND_FILTER_NAME:
+            return facet
+    return None
+
+
+def facet_key(facet: dict):
+    """Идентификатор фасета, который нужно передать обратно в запросе"""
+    return facet.get("key") or facet.get("alias") or facet.get("slug") or facet.get("id")
+
+
+def facet_values(facet: dict) -> list:
+    """Значения фасета в виде списка (значение для фильтра, название бренда)"""
+    values = []
+    for value in facet.get("values", []):
+        if isinstance(value, dict):
+            filter_value = value.get("value", value.get("id", value.get("name")))
+            values.append((filter_value, value.get("name") or str(filter_value)))
+        else:
+            values.append((value, str(value)))
+    return values
+
+
+def facet_counts(facet: dict) -> dict:
+    """Число товаров по значениям фасета, если сервер его отдает: {значение для фильтра: число}"""
+    counts = {}
+    for value in facet.get("values", []):
+        if isinstance(value, dict):
+            count = value.get("count", value.get("productsCount"))
+            if isinstance(count, int):
+                counts[value.get("value", value.get("id", value.get("name")))] = count
+    return counts
+
+
+class BrandResolver:
+    """Массовое определение брендов через фасетные фильтры каталога.
+
+    Вместо запроса `/v1/catalog/items/{id}` на каждый товар читает значения
+    фасета «Бренд» категории и делает по одному отфильтрованному запросу
+    `get_catalog_items` на бренд — O(брендов) вместо O(товаров).
+    Работает в контексте текущего магазина клиента.
+
+    Формат фильтра не подтвержден документацией, поэтому перед тем как верить
+    результату, резолвер проверяет, что фильтр действительно применился: число
+    товаров с фильтром меньше, чем во всей категории (и совпадает со счетчиком
+    фасета, если он есть), а бренд одного товара из выдачи совпадает с брендом
+    из его карточки. Если проверка не прошла, бренды не определяются (вызывающий
+    код запрашивает их по товарам) и в кэш ничего не пишется.
+    """
+
+    def __init__(self, api: LentaAPI, brand_cache: Optional[BrandCache] = None, page_size: int = 200):
+        self.api: LentaAPI = api
+        self.brand_cache: Optional[BrandCache] = brand_cache
+        self.page_size = page_size
+
+    def verify_filter(self, category_id: int, facet: dict, category_total: int) -> bool:
+        """Проверяет на первых брендах фасета, что сервер применяет фильтр по бренду"""
+        key, values, counts = facet_key(facet), facet_values(facet), facet_counts(facet)
+        for value, brand in values[:VERIFY_BRANDS]:
+            filters = {"multicheckbox": [{"key": key, "values": [value]}]}
+            page = self.api.get_catalog_items(category_id, limit=1, offset=0, filters=filters) or {}
+            total = page.get("total", 0)
+            if len(values) > 1 and total >= category_total:
+                logger.warning(f"⚠️ Фильтр по бренду {brand} не сузил выдачу категории {category_id} "
+                               f"({total} из {category_total} товаров)")
+                return False
+            if value in counts and total != counts[value]:
+                logger.warning(f"⚠️ С фильтром по бренду {brand} найдено {total} товаров, а в фасете {counts[value]}")
+                return False
+            items = page.get("items", [])
+            if not items:
+                continue
+            actual = extract_brand(self.api.get_catalog_item(items[0]["id"]))
+            if actual.casefold() != str(brand).casefold():
+                logger.warning(f"⚠️ Товар {items[0]['id']} из выдачи с фильтром по бренду {brand} "
+                               f"в карточке имеет бренд {actual}")
+                return False
+            return True
+        logger.warning(f"⚠️ Не удалось проверить фильтр по бренду в категории {category_id}")
+        return False
+
+    def resolve(self, category_id: int, product_ids: Iterable[int], max_brands: Optional[int] = None) -> dict:
+        """Определяет бренды товаров категории.
+
+        :param product_ids: id товаров, бренды которых нужны
+        :param max_brands: если брендов больше, фасеты не используются (дешевле спросить по товарам)
+        :return: {id товара: бренд} только для найденных товаров
+        """
+        pending = set(product_ids)
+        if not pending:
+            return {}
+
+        page = self.api.get_catalog_items(category_id, limit=1, offset=0) or {}
+        facet = find_brand_facet(page.get("filters", {}))
+        if facet is None:
+            logger.warning(f"⚠️ В категории {category_id} нет фасета бренда")
+            return {}
+
+        values = facet_values(facet)
+        if max_brands is not None and len(values) > max_brands:
+            logger.info(f"ℹ️ В категории {category_id} {len(values)} брендов — больше {max_brands}, фасеты не используются")
+            return {}
+
+        if not self.verify_filter(category_id, facet, page.get("total", 0)):
+            logger.warning(f"⚠️ Бренды категории {category_id} будут запрошены по товарам")
+            return {}
+
+        key = facet_key(facet)
+        resolved = {}
+        for i, (value, brand) in enumerate(values):
+            if not pending:
+                break
+            filters = {"multicheckbox": [{"key": key, "values": [value]}]}
+            for item in self.api.iter_catalog_items(category_id, page_size=self.page_size, filters=filters,
+                                                    stop=lambda _: not pending, lean=True):
+                if item.id in pending:
+                    pending.discard(item.id)
+                    resolved[item.id] = brand
+            logger.info(f"🏷️ Бренд {brand}: найдено {len(resolved)} товаров, осталось {len(pending)} ({i+1}/{len(values)})")
+
+        if self.brand_cache is not None and resolved:
+            self.brand_cache.set_many(resolved)
+        return resolved
@@ -0,0 +1,73 @@
+import json
+from typing import Optional, Union
+
+
+class CatalogItem:
+    """Товар из `/v1/catalog/items` только с полями, которые нужны парсеру.
+
+    Полный ответ (картинки, бейджи, размеры, рейтинг и т.д.) занимает в памяти
+    в десятки раз больше, поэтому хранится в `raw` только в режиме отладки."""
+
+    __slots__ = ("id", "name", "price", "cost_regular", "count", "is_blocked_for_sale", "store_id", "raw")
+
+    def __init__(self, id: int, name: str, price: int, cost_regular: int, count: int,
+                 is_blocked_for_sale: bool = False, store_id: Optional[int] = None, raw: Optional[dict] = None):
+        self.id = id
+        self.name = name
+        self.price = price  # prices.cost, в копейках
+        self.cost_regular = cost_regular  # prices.costRegular, в копейках
+        self.count = count
+        self.is_blocked_for_sale = is_blocked_for_sale
+        self.store_id = store_id
+        self.raw = raw
+
+    @classmethod
+    def from_payload(cls, item: dict, keep_raw: bool = False) -> "CatalogItem":
+        return cls(
+            item["id"],
+            item["name"],
+            item["prices"]["cost"],
+            item["prices"]["costRegular"],
+            item["count"],
+            item.get("features", {}).get("isBlockedForSale", False),
+            item.get("storeId"),
+            item if keep_raw else None,
+        )
+
+    @property
+    def available(self) -> bool:
+        """В наличии и не заблокирован для продажи"""
+        return self.count > 0 and not self.is_blocked_for_sale
+
+    def to_dict(self) -> dict:
+        """Компактная запись для JSON (без `raw`)"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "price": self.price,
+            "costRegular": self.cost_regular,
+            "count": self.count,
+            "isBlockedForSale": self.is_blocked_for_sale,
+            "storeId": self.store_id,
+        }
+
+    def __repr__(self):
+        return f"CatalogItem({self.id}, {self.name!r}, price={self.price}, count={self.count})"
+
+
+def parse_catalog_page(content: Union[str, bytes], keep_raw: bool = False) -> Optional[dict]:
+    """Разбирает ответ `/v1/catalog/items` в {"items": [CatalogItem, ...], "total": ...}.
+
+    Товары превращаются в `CatalogItem` прямо во время разбора JSON (`object_hook`),
+    поэтому полные словари товаров не накапливаются. Фильтры и категории страницы
+    отбрасываются."""
+    if not content:
+        return None
+
+    def hook(obj: dict):
+        if "prices" in obj and "features" in obj and "id" in obj:
+            return CatalogItem.from_payload(obj, keep_raw)
+        return obj
+
+    page = json.loads(content, object_hook=hook)
+    return {"items": page.get("items", []), "total": page.get("total", 0)}
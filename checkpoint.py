@@ -0,0 +1,108 @@
+import os
+import json
+from typing import Iterable, Iterator, Optional
+
+
+def atomic_write_json(path: str, data, **dump_kwargs):
+    """Записывает JSON через временный файл и `os.replace`, чтобы при падении не остался обрывок"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ResultStream:
+    """Поток результатов в JSONL: каждый обогащенный товар дописывается сразу.
+
+    Запись идет только в конец файла с `fsync`, поэтому при падении сохраняется
+    все, что уже было получено. Оборванная последняя строка при чтении пропускается.
+    """
+
+    def __init__(self, path: str = "lenta_products_piter_moscow.jsonl"):
+        self.path = path
+
+    def append(self, record: dict):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __iter__(self) -> Iterator[dict]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Строка, которую не успели дописать до падения
+                    continue
+
+    def repair(self):
+        """Обрезает недописанную последнюю строку, чтобы новые записи не склеились с ней"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def completed_ids(self) -> set:
+        return {record["id"] for record in self}
+
+    def records(self, order: Optional[Iterable] = None) -> list:
+        """Записи потока без повторов (последняя запись по id побеждает).
+
+        :param order: порядок id в результате; по умолчанию — порядок первого появления
+        """
+        records = {}
+        for record in self:
+            records[record["id"]] = record
+        ids = [product_id for product_id in order if product_id in records] if order is not None else list(records)
+        return [records[product_id] for product_id in ids]
+
+    def compact(self, path: str, order: Optional[Iterable] = None) -> list:
+        """Собирает из потока итоговый JSON-массив в `path`"""
+        data = self.records(order)
+        atomic_write_json(path, data, indent=4)
+        return data
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Checkpoint:
+    """Состояние прогона для `--resume`: выбранные магазины, категория, товары и готовые id"""
+
+    def __init__(self, path: str = "lenta_checkpoint.json"):
+        self.path = path
+        self.state: dict = {}
+
+    def load(self) -> bool:
+        """Загружает состояние с диска, возвращает False, если чекпоинта нет"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            self.state = json.load(f)
+        return True
+
+    def save(self, **updates):
+        """Обновляет поля состояния и атомарно сохраняет его"""
+        self.state.update(updates)
+        atomic_write_json(self.path, self.state)
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def mark_completed(self, product_id):
+        completed = self.state.setdefault("completed", [])
+        completed.append(product_id)
+        atomic_write_json(self.path, self.state)
+
+    def clear(self):
+        self.state = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,182 @@
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from LentaAPI import LentaAPI
+from store_sessions import StoreSessionPool
+from price_history import PriceHistory, rows_from_items
+from logger import get_logger
+logger = get_logger()
+
+
+def find_leaf_categories(categories: list) -> list:
+    """Листовые категории дерева из `get_categories()` (по `parentId`/`hasChildren`)"""
+    parent_ids = {category["parentId"] for category in categories}
+    return [
+        category for category in categories
+        if not category.get("hasChildren") and category["id"] not in parent_ids
+    ]
+
+
+@dataclass
+class CategoryProgress:
+    """Прогресс обхода одной листовой категории"""
+    category_id: int
+    name: str
+    total: int = 0
+    fetched: int = 0
+    new_items: int = 0
+    requests: int = 0
+    done: bool = False
+    seconds: float = 0.0
+
+
+@dataclass
+class CrawlResult:
+    """Снимок каталога магазина: уникальные товары и статистика по категориям"""
+    items: dict = field(default_factory=dict)  # id товара -> CatalogItem
+    categories: dict = field(default_factory=dict)  # id категории -> CategoryProgress
+    product_categories: dict = field(default_factory=dict)  # id товара -> [id категорий]
+    requests: int = 0
+    seconds: float = 0.0
+
+
+class CategoryCrawler:
+    """Параллельный обход всего дерева категорий одного магазина.
+
+    Спускается по дереву до листовых категорий, по первой странице каждого листа
+    узнает его размер (`total`) и раздает листы воркерам от больших к меньшим,
+    чтобы длинные категории не остались на конец. Товары, которые встречаются в
+    нескольких категориях, сохраняются один раз. Скорость задает общий
+    ограничитель клиента, а `max_requests` ограничивает число запросов за обход.
+    """
+
+    def __init__(self, api: LentaAPI, workers: int = 4, page_size: int = 200, max_requests: Optional[int] = None,
+                 on_progress: Optional[Callable[[CategoryProgress], None]] = None):
+        """
+        :param api: клиент с уже выбранным магазином
+        :param workers: число потоков обхода
+        :param max_requests: бюджет запросов на весь обход (None — без ограничения)
+        :param on_progress: вызывается после каждой страницы категории
+        """
+        self.api = api
+        self.workers = workers
+        self.page_size = page_size
+        self.max_requests = max_requests
+        self.on_progress = on_progress or self._log_progress
+        self._lock = threading.Lock()
+        self._result = CrawlResult()
+
+    @staticmethod
+    def _log_progress(progress: CategoryProgress):
+        state = "✅" if progress.done else "⏳"
+        logger.info(f"{state} {progress.name} ({progress.category_id}): {progress.fetched}/{progress.total}, "
+                    f"новых {progress.new_items}, запросов {progress.requests}")
+
+    def _take_request(self) -> bool:
+        """Списывает один запрос из бюджета"""
+        with self._lock:
+            if self.max_requests is not None and self._result.requests >= self.max_requests:
+                return False
+            self._result.requests += 1
+            return True
+
+    def _store_page(self, progress: CategoryProgress, items: list):
+        with self._lock:
+            for item in items:
+                categories = self._result.product_categories.setdefault(item.id, [])
+                categories.append(progress.category_id)
+                if len(categories) == 1:
+                    self._result.items[item.id] = item
+                    progress.new_items += 1
+            progress.fetched += len(items)
+            progress.requests += 1
+
+    def _fetch_page(self, progress: CategoryProgress, offset: int) -> Optional[list]:
+        if not self._take_request():
+            logger.warning(f"⚠️ Бюджет запросов исчерпан, категория {progress.name} обойдена не полностью")
+            return None
+        page = self.api.get_catalog_items(progress.category_id, limit=self.page_size, offset=offset, lean=True) or {}
+        progress.total = page.get("total", progress.total)
+        items = page.get("items", [])
+        self._store_page(progress, items)
+        return items
+
+    def _probe(self, category: dict) -> CategoryProgress:
+        """Первая страница категории: дает `total` для планирования и сразу первые товары"""
+        progress = CategoryProgress(category["id"], category.get("name", str(category["id"])))
+        started = time.monotonic()
+        items = self._fetch_page(progress, 0)
+        progress.done = items is None or not items or progress.fetched >= progress.total
+        progress.seconds = time.monotonic() - started
+        self.on_progress(progress)
+        return progress
+
+    def _crawl_rest(self, progress: CategoryProgress):
+        """Дочитывает категорию после первой страницы"""
+        started = time.monotonic()
+        while progress.fetched < progress.total:
+            items = self._fetch_page(progress, progress.fetched)
+            if not items:
+                break
+            self.on_progress(progress)
+        progress.done = True
+        progress.seconds += time.monotonic() - started
+        self.on_progress(progress)
+
+    def crawl(self, categories: Optional[list] = None) -> CrawlResult:
+        """Обходит все листовые категории и возвращает снимок каталога"""
+        started = time.monotonic()
+        categories = categories if categories is not None else self.api.get_categories()
+        leaves = find_leaf_categories(categories)
+        logger.info(f"🌳 Категорий: {len(categories)}, листовых: {len(leaves)}")
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crawler") as executor:
+            # Первые страницы дают размер каждой категории
+            probes = [executor.submit(self._probe, leaf) for leaf in leaves]
+            progresses = [future.result() for future in as_completed(probes)]
+            for progress in progresses:
+                self._result.categories[progress.category_id] = progress
+
+            # Самые большие категории — первыми (жадное планирование LPT)
+            pending = sorted((p for p in progresses if not p.done), key=lambda p: p.total - p.fetched, reverse=True)
+            for future in as_completed([executor.submit(self._crawl_rest, progress) for progress in pending]):
+                future.result()
+
+        self._result.seconds = time.monotonic() - started
+        logger.info(f"🌳 Обход завершен: {len(self._result.items)} уникальных товаров, "
+                    f"{self._result.requests} запросов, {self._result.seconds:.1f}с")
+        return self._result
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Полный снимок каталога магазинов Ленты")
+    arg_parser.add_argument("store_ids", type=int, nargs="+")
+    arg_parser.add_argument("--workers", type=int, default=4)
+    arg_parser.add_argument("--max-requests", type=int, default=None)
+    arg_parser.add_argument("--history", action="store_true", help="дописать цены и остатки в историю цен")
+    args = arg_parser.parse_args()
+
+    with StoreSessionPool(max_workers=len(args.store_ids)) as store_sessions:
+        def crawl_store(api: LentaAPI) -> CrawlResult:
+            return CategoryCrawler(api, workers=args.workers, max_requests=args.max_requests).crawl()
+
+        results = store_sessions.map(crawl_store, args.store_ids)
+
+    for store_id, result in results.items():
+        path = f"lenta_catalog_{store_id}.jsonl"
+        with open(path, "w", encoding="utf-8") as f:
+            for item in result.items.values():
+                f.write(json.dumps(item.to_dict(), ensure_ascii=False) + "\n")
+        print(f"✅ Магазин {store_id}: {len(result.items)} товаров сохранено в {path}")
+
+    if args.history:
+        with PriceHistory() as history:
+            written = history.append_run(
+                row for store_id, result in results.items() for row in rows_from_items(store_id, result.items.values())
+            )
+        print(f"📈 В историю цен записано {written} строк")
@@ -0,0 +1,227 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from requests import HTTPError
+
+from LentaAPI import LentaAPI
+from transport import HTTPTransport
+from ratelimit import AdaptiveRateLimiter, get_default_rate_limiter
+from response_cache import ResponseCache
+from logger import get_logger
+logger = get_logger()
+
+T = TypeVar("T")
+
+
+class ClientIdentity:
+    """Одна личность клиента: свой `LentaAPI` (DeviceId + SessionToken) и счетчики запросов"""
+
+    __slots__ = ("api", "requests", "throttled", "last_used_at", "last_throttled_at", "cooldown_until", "retired")
+
+    def __init__(self, api: LentaAPI):
+        self.api = api
+        self.requests = 0
+        self.throttled = 0
+        self.last_used_at = 0.0
+        self.last_throttled_at = 0.0
+        self.cooldown_until = 0.0
+        self.retired = False
+
+    @property
+    def device_id(self) -> str:
+        return self.api.device_id
+
+    def __repr__(self):
+        return f"ClientIdentity({self.device_id}, requests={self.requests}, throttled={self.throttled})"
+
+
+class IdentityPool:
+    """Пул личностей клиента с заблаговременной ротацией SessionToken.
+
+    Запросы распределяются между личностями по кругу (`round_robin`) или
+    выбирается та, что дольше всех не получала 429 (`least_throttled`).
+    После 429 личность уходит на паузу `throttle_cooldown`, а запросы идут
+    через остальные. Личность выводится из оборота, не дожидаясь лимита:
+    после `max_requests_per_identity` запросов или `max_throttles` ответов 429.
+    Замена с новым DeviceId и SessionToken готовится в фоновом потоке.
+    Первые личности создаются только при первом запросе, поэтому пул,
+    которым так и не воспользовались, не делает ни одного запроса.
+    """
+
+    STRATEGIES = ("least_throttled", "round_robin")
+
+    def __init__(self, size: int = 3, max_requests_per_identity: int = 150, throttle_cooldown: float = 60.0,
+                 max_throttles: int = 2, strategy: str = "least_throttled", transport: Optional[HTTPTransport] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None, api_factory: Callable[..., LentaAPI] = LentaAPI,
+                 response_cache: Optional[ResponseCache] = None, max_creation_attempts: int = 5,
+                 acquire_timeout: float = 300.0):
+        """
+        :param size: сколько личностей держать в работе
+        :param max_requests_per_identity: после скольких запросов личность заменяется
+        :param throttle_cooldown: сколько секунд не использовать личность после 429
+        :param max_throttles: после скольких 429 личность заменяется
+        :param strategy: "least_throttled" или "round_robin"
+        :param api_factory: фабрика клиентов, принимает `transport=`, `rate_limiter=`, `response_cache=` и `max_throttle_retries=`
+        :param response_cache: общий кэш ответов клиентов (None — без кэша)
+        :param max_creation_attempts: сколько раз пробовать получить SessionToken для новой личности
+        :param acquire_timeout: сколько секунд `call` ждет свободную личность
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Неизвестная стратегия {strategy}, доступны: {', '.join(self.STRATEGIES)}")
+        self.size = size
+        self.max_requests_per_identity = max_requests_per_identity
+        self.throttle_cooldown = throttle_cooldown
+        self.max_throttles = max_throttles
+        self.strategy = strategy
+        self.transport = transport or HTTPTransport()
+        self.rate_limiter = rate_limiter or get_default_rate_limiter()
+        self.api_factory = api_factory
+        self.response_cache = response_cache
+        self.max_creation_attempts = max_creation_attempts
+        self.acquire_timeout = acquire_timeout
+
+        self._identities: list = []
+        self._pending = 0
+        self._next_index = 0
+        self._started = False
+        self._last_error: Optional[Exception] = None  # последняя ошибка создания личности
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="identity")
+
+    def _create_identity(self) -> ClientIdentity:
+        # Повторы после 429 делает пул на другой личности, а не клиент на этой же
+        api = self.api_factory(transport=self.transport, rate_limiter=self.rate_limiter,
+                               response_cache=self.response_cache, max_throttle_retries=0)
+        # Retry-After одной личности не должен останавливать остальные: у хоста общая только скорость
+        api.rate_limit_client = api.device_id
+        api.get_session_token()
+        return ClientIdentity(api)
+
+    def _schedule_new_identity(self):
+        """Готовит новую личность в фоне (вызывается под блокировкой)"""
+        self._pending += 1
+        self._executor.submit(self._add_new_identity)
+
+    def _start(self):
+        """Заказывает первые `size` личностей при первом запросе (вызывается под блокировкой)"""
+        if self._started:
+            return
+        self._started = True
+        for _ in range(self.size):
+            self._schedule_new_identity()
+
+    def _add_new_identity(self, attempt: int = 1):
+        try:
+            identity = self._create_identity()
+        except Exception as e:
+            logger.error(f"❌ Не удалось получить SessionToken для новой личности "
+                         f"(попытка {attempt}/{self.max_creation_attempts}): {e}")
+            with self._ready:
+                self._last_error = e
+            if attempt < self.max_creation_attempts:
+                time.sleep(min(self.throttle_cooldown / 4, 2 ** attempt))
+                self._executor.submit(self._add_new_identity, attempt + 1)
+                return
+            with self._ready:
+                # Замены не будет: ждущие в `acquire` должны узнать об этом
+                self._pending -= 1
+                self._ready.notify_all()
+            return
+
+        with self._ready:
+            self._pending -= 1
+            self._identities.append(identity)
+            self._ready.notify_all()
+        logger.info(f"🆔 Готова новая личность {identity.device_id}")
+
+    def _retire(self, identity: ClientIdentity, reason: str):
+        """Выводит личность из оборота и заказывает замену (вызывается под блокировкой)"""
+        if identity.retired:
+            return
+        identity.retired = True
+        self._identities.remove(identity)
+        self._schedule_new_identity()
+        logger.info(f"♻️ Личность {identity.device_id} выведена ({reason}), готовится замена")
+
+    def _choose(self, now: float) -> Optional[ClientIdentity]:
+        available = [identity for identity in self._identities if identity.cooldown_until <= now]
+        if not available:
+            return None
+        if self.strategy == "round_robin":
+            self._next_index = (self._next_index + 1) % len(available)
+            return available[self._next_index]
+        return min(available, key=lambda identity: (identity.last_throttled_at, identity.last_used_at))
+
+    def acquire(self, timeout: Optional[float] = None) -> ClientIdentity:
+        """Выбирает личность для следующего запроса.
+
+        Ждет только если свободных личностей нет совсем (все на паузе после 429
+        и замены еще не готовы). Если личностей нет и ни одна не готовится,
+        пробрасывает последнюю ошибку их создания."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._ready:
+            self._start()
+            while True:
+                now = time.time()
+                identity = self._choose(now)
+                if identity is not None:
+                    identity.requests += 1
+                    identity.last_used_at = now
+                    if identity.requests >= self.max_requests_per_identity:
+                        self._retire(identity, f"{identity.requests} запросов")
+                    return identity
+
+                if not self._identities and not self._pending and self._last_error is not None:
+                    raise self._last_error
+
+                cooling = [identity.cooldown_until - now for identity in self._identities]
+                wait = min(cooling) if cooling else None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Нет свободных личностей клиента")
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._ready.wait(wait)
+
+    def report_throttle(self, identity: ClientIdentity):
+        """Сообщает о 429: личность уходит на паузу, а после `max_throttles` — заменяется"""
+        now = time.time()
+        with self._ready:
+            identity.throttled += 1
+            identity.last_throttled_at = now
+            identity.cooldown_until = now + self.throttle_cooldown
+            if identity.throttled >= self.max_throttles:
+                self._retire(identity, f"{identity.throttled} ответов 429")
+
+    def call(self, func: Callable[[LentaAPI], T], max_attempts: int = 7) -> T:
+        """Выполняет `func(api)`, при 429 повторяя на другой личности"""
+        for attempt in range(max_attempts):
+            identity = self.acquire(timeout=self.acquire_timeout)
+            try:
+                return func(identity.api)
+            except HTTPError as e:
+                if e.response is None or e.response.status_code != 429:
+                    raise
+                self.report_throttle(identity)
+                logger.warning(f"⚠️ 429 у личности {identity.device_id} (попытка {attempt+1}/{max_attempts})")
+        raise TimeoutError(f"❌ Запрос не удался за {max_attempts} попыток на разных личностях")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": len(self._identities),
+                "pending": self._pending,
+                "identities": [repr(identity) for identity in self._identities],
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,167 +1,409 @@
 import json
-import time
 import random
-from requests import HTTPError
+import argparse
+import threading
+from functools import partial
+from typing import Callable, Iterable, Optional
 
-from LentaAPI import LentaAPI
+from catalog_item import CatalogItem
+from LentaAPI import LentaAPI, setup_logging
+from brand_cache import BrandCache
+from brand_resolver import BrandResolver, extract_brand
+from store_sessions import StoreSessionPool
+from identity import IdentityPool
+from ratelimit import AdaptiveRateLimiter
+from replay import RecordingTransport, ReplayTransport
+from response_cache import ResponseCache
+from store_directory import StoreDirectory
+from checkpoint import Checkpoint, ResultStream, atomic_write_json
+from snapshot import SnapshotStore, diff_snapshots, snapshot_record
+from pipeline import Pipeline, StageProfiler, ordered_prefetch
 from logger import get_logger
 logger = get_logger()
 
+
+def is_available(item: CatalogItem) -> bool:
+    """Товар в наличии и не заблокирован для продажи"""
+    return item.available
+
+
+def to_product(item: CatalogItem) -> dict:
+    """Запись товара для итогового JSON"""
+    return {
+        "id": item.id,
+        "name": item.name,
+        "regular_price": item.cost_regular / 100,
+        "promo_price": item.price / 100
+    }
+
+
+def find_common_products(moscow_items: Iterable[CatalogItem], piter_items: Iterable[CatalogItem], limit: int = 101) -> list:
+    """Находит товары в наличии, общие для двух списков товаров.
+
+    `moscow_items` перебирается лениво и только до `limit` найденных товаров."""
+    piter_ids = {item.id for item in piter_items if is_available(item)}
+
+    common_products = []
+    for item in moscow_items:
+        if len(common_products) >= limit:
+            break
+        if is_available(item) and item.id in piter_ids:
+            common_products.append(to_product(item))
+    return common_products
+
+
+def prefer_stores(store_ids: Iterable) -> Callable[[list], tuple]:
+    """Выбор магазина для `LentaParser(store_choice=...)`: первый из `store_ids`, который есть
+    в городе, иначе случайный. Так при воспроизведении кассеты берутся записанные магазины"""
+    store_ids = list(store_ids)
+
+    def choose(stores: list) -> tuple:
+        by_id = {store[0]: store for store in stores}
+        for store_id in store_ids:
+            if store_id in by_id:
+                return by_id[store_id]
+        return random.choice(stores)
+    return choose
+
+
 class LentaParser:
     """Класс для автоматического парсинга товаров в наличии из приложения Лента в МСК и Питере, где более 100 товаров"""
     
     TARGET_CITIES = {"Москва", "Санкт-Петербург"}
-    REQUEST_DELAY = 2  # Задержка между запросами в секундах
-    BATCH_SIZE = 10  # Количество запросов перед длинной паузой
-    BATCH_DELAY = 15  # Длинная пауза после батча
+    PRODUCTS_LIMIT = 101  # Сколько общих товаров нужно найти
+    RESULTS_FILE = "lenta_products_piter_moscow.json"
+    DELTA_FILE = "lenta_products_delta.json"
 
-    def __init__(self, api: LentaAPI):
+    def __init__(self, api: LentaAPI, brand_cache: Optional[BrandCache] = None, brand_mode: str = "items",
+                 store_sessions: Optional[StoreSessionPool] = None, identities: Optional[IdentityPool] = None,
+                 stream: Optional[ResultStream] = None, checkpoint: Optional[Checkpoint] = None,
+                 snapshots: Optional[SnapshotStore] = None, store_directory: Optional[StoreDirectory] = None,
+                 profiler: Optional[StageProfiler] = None, search_workers: int = 2, enrich_workers: int = 4,
+                 store_choice: Callable[[list], tuple] = random.choice):
+        """
+        :param brand_mode: "items" — бренд запрашивается отдельно для каждого товара,
+            "facets" — пачками через фильтры категории (формат фильтра еще не проверен
+            на настоящем API; если фильтр не применяется, бренды запрашиваются по товарам)
+        :param store_sessions: пул клиентов, привязанных к магазинам (по умолчанию делит транспорт и ограничитель с `api`)
+        :param identities: пул личностей для запросов подробностей товаров
+        :param stream: JSONL-файл, куда товар дописывается сразу после обогащения
+        :param checkpoint: состояние прогона для продолжения после падения
+        :param snapshots: снимки прошлого прогона; если заданы, работает инкрементальный режим —
+            бренды запрашиваются только для новых и изменившихся товаров
+        :param store_directory: кэшируемый справочник магазинов
+        :param profiler: время этапов прогона (`stores`, `categories`, `search`, `enrich`, `finalize`
+            и этапы конвейера обогащения `fetch_brand`, `record`)
+        :param search_workers: сколько категорий проверять одновременно
+        :param enrich_workers: сколько товаров одновременно обогащать запросами по товару
+        :param store_choice: выбор магазина из гипермаркетов города (по умолчанию случайный)
+        """
         self.api: LentaAPI = api
+        # Клиенты пулов обращаются к тем же адресам, что и `api` (например, к stub-серверу)
+        api_factory = partial(LentaAPI, lentochka_url=api.LENTOCHKA_URL, api_url=api.API_LENTA_URL)
+        self.store_sessions = store_sessions or StoreSessionPool(transport=api.transport, rate_limiter=api.rate_limiter,
+                                                                 response_cache=api.response_cache, api_factory=api_factory)
+        self.identities = identities or IdentityPool(transport=api.transport, rate_limiter=api.rate_limiter,
+                                                     response_cache=api.response_cache, api_factory=api_factory)
+        self.brand_cache: Optional[BrandCache] = brand_cache
+        self.brand_mode = brand_mode
         self.city_stores = {"Москва": [], "Санкт-Петербург": []}
-        self.last_request_time = 0
-    
-    def _rate_limited_request(self):
-        """Обеспечивает задержку между запросами"""
-        elapsed = time.time() - self.last_request_time
-        if elapsed < self.REQUEST_DELAY:
-            time.sleep(random.uniform(1.2, 2.4))
-        self.last_request_time = time.time()
+        self.stream = stream or ResultStream()
+        self.checkpoint = checkpoint or Checkpoint()
+        self.snapshots: Optional[SnapshotStore] = snapshots
+        self.store_directory = store_directory or StoreDirectory()
+        self.profiler = profiler or StageProfiler()
+        self.search_workers = search_workers
+        self.enrich_workers = enrich_workers
+        self.store_choice = store_choice
 
     def _get_target_stores(self):
         """Фильтрует магазины только в Москве и Санкт-Петербурге"""
-        stores = self.api.get_stores()
-        for store in stores["items"]:
-            for city in self.TARGET_CITIES:
-                if city in store["addressFull"] and store['marketType'] == "HM": # Проверка на город и Гипермаркет(больше товаров)
-                    self.city_stores[city].append((store["id"], store["addressFull"]))
-                    break
-        
-        if not self.city_stores:
+        self.city_stores = self.store_directory.index(self.api).select(self.TARGET_CITIES, market_type="HM")
+
+        if not all(self.city_stores.values()):
             raise ValueError("Нет доступных магазинов в Москве и Санкт-Петербурге")
 
-    def _get_brand_of_product(self, product_id, max_retries=7, backoff_factor=3):
-        """Получает бренд товара по его ID с повторными попытками при ошибках"""
-        import uuid
-        self._rate_limited_request()  # Добавляем задержку перед каждым запросом
-
-        attempt = 0
-        while attempt < max_retries: # Дефолтное значение будет доходить до целой минуты
-            try:
-                data = self.api.get_catalog_item(product_id)
-                for attribute in data.get('attributes', []):
-                    if attribute['alias'] == 'brand' or attribute['name'] == 'Бренд' or attribute['slug'] == 'brand':
-                        return attribute['value']
-                
-                return "Без бренда"
-            except HTTPError as e:
-                logger.error(f"❌ Ошибка HTTP: {e.response.status_code} - {e.response.text}")
-                if e.response.status_code == 429:
-                    # wait_time = (backoff_factor ** attempt) + random.uniform(1, 3)
-                    wait_time = 60 * (attempt + 1)
-                    print(f"⚠️ Превышен лимит запросов (попытка {attempt+1}/{max_retries}), пауза {wait_time:.1f}с")
-                    time.sleep(wait_time)
-                    self.api.device_id = f"A-{uuid.uuid4()}"
-                    self.api.headers["DeviceId"] = self.api.device_id
-                    self.api.get_session_token()
-                    attempt += 1
-                else:
-                    raise
-
-        raise TimeoutError(f"❌ Не удалось получить бренд товара за {max_retries} попыток."
-                           " Лучше перезапустить программу и подождать некоторое время")
-
-    def run(self):
-        """Основная логика парсинга"""
-        self._get_target_stores()
-
-        # Получаем категории первого уровня в МСК
-        moscow_stores = self.city_stores["Москва"]
-        moscow_store, moscow_store_location = random.choice(moscow_stores)
-        print(f"📍 Москва, магазин ID: {moscow_store}, адрес: {moscow_store_location}")
-        self.api.set_delivery(moscow_store)
-        self.api.set_store(moscow_store)
-        moscow_categories_level_1 = {
-            x['slug']: x['id']
-            for x in self.api.get_categories()
-            if x['level'] == 1
+    def _get_brand_of_product(self, product_id, max_retries=7):
+        """Получает бренд товара по его ID. При 429 запрос повторяется
+        на другой личности из пула, а не после долгой паузы"""
+        def fetch(api: LentaAPI):
+            data = api.get_catalog_item(product_id)
+            brand = extract_brand(data)
+            if self.brand_cache is not None:
+                self.brand_cache.set(product_id, brand, data.get('attributes'))
+            return brand
+
+        try:
+            return self.identities.call(fetch, max_attempts=max_retries)
+        except TimeoutError:
+            raise TimeoutError(f"❌ Не удалось получить бренд товара за {max_retries} попыток."
+                               " Лучше перезапустить программу и подождать некоторое время")
+
+    def _enrich_with_brands(self, products: list, category_id: Optional[int] = None, store_api: Optional[LentaAPI] = None,
+                            on_product: Optional[Callable[[dict], None]] = None):
+        """Добавляет бренды к товарам: из кэша, затем через фасеты категории
+        (в магазине клиента `store_api`), оставшиеся — запросом по каждому товару.
+        `on_product` вызывается для каждого товара, как только у него появился бренд"""
+        cached, misses = ({}, [product["id"] for product in products])
+        if self.brand_cache is not None:
+            cached, misses = self.brand_cache.get_many(misses)
+            print(f"💾 Бренды из кэша: {len(cached)}, нужно запросить: {len(misses)}")
+
+        if misses and self.brand_mode == "facets" and category_id is not None:
+            resolved = BrandResolver(store_api or self.api, self.brand_cache).resolve(category_id, misses, max_brands=len(misses))
+            cached.update(resolved)
+            misses = [product_id for product_id in misses if product_id not in resolved]
+            print(f"🏷️ Бренды через фильтры категории: {len(resolved)}, осталось запросить по товарам: {len(misses)}")
+
+        # Бренды по товарам запрашиваются в нескольких потоках, а готовые товары
+        # записывает один поток, поэтому запись на диск не задерживает запросы
+        done = []
+
+        def fetch_brand(product: dict):
+            if product["id"] in cached:
+                product["brand"] = cached[product["id"]]
+            else:
+                product["brand"] = self._get_brand_of_product(product["id"])
+            return [product]
+
+        def record(product: dict):
+            if on_product is not None:
+                on_product(product)
+            done.append(product["id"])
+            if product["id"] not in cached:
+                print(f"🛒 {product['name']} ({product['id']}) добавлен в список ({len(done)}/{len(products)})")
+
+        workers = max(1, min(self.enrich_workers, len(products) - len(cached)))
+        pipeline = Pipeline(self.profiler).stage("fetch_brand", fetch_brand, workers).stage("record", record)
+        for _ in pipeline.run(products):
+            pass
+
+    def _record_product(self, product: dict):
+        """Сохраняет обогащенный товар в поток и отмечает его в чекпоинте"""
+        self.stream.append(product)
+        self.checkpoint.mark_completed(product["id"])
+
+    def _choose_stores(self) -> dict:
+        """Случайный гипермаркет в каждом городе (или магазины из чекпоинта).
+        В инкрементальном режиме берутся магазины прошлого прогона, чтобы было с чем сравнивать"""
+        stores = self.checkpoint.get("stores")
+        if not stores and self.snapshots is not None:
+            stores = self.snapshots.load_meta().get("stores")
+            if stores:
+                self.checkpoint.save(stores=stores)
+        if not stores:
+            self._get_target_stores()
+            stores = {
+                "Москва": self.store_choice(self.city_stores["Москва"]),
+                "Санкт-Петербург": self.store_choice(self.city_stores["Санкт-Петербург"]),
+            }
+            self.checkpoint.save(stores=stores)
+        return stores
+
+    def _find_common_products(self, moscow_api: LentaAPI, piter_store, moscow_category: int, piter_category: int,
+                              moscow_records: Optional[dict] = None, piter_records: Optional[dict] = None,
+                              cancel: Optional[threading.Event] = None) -> list:
+        """Общие товары в наличии в категории (не больше PRODUCTS_LIMIT).
+
+        В `moscow_records`/`piter_records`, если переданы, складываются снимки
+        просмотренных товаров каждого магазина. Если выставить `cancel`, чтение
+        каталога прекращается на ближайшем товаре (результат тогда неполный)."""
+        def cancelled(_=None) -> bool:
+            return cancel is not None and cancel.is_set()
+
+        def collect_piter_ids(api: LentaAPI) -> set:
+            ids = set()
+            for item in api.iter_catalog_items(piter_category, stop=cancelled, lean=True):
+                if piter_records is not None:
+                    piter_records[item.id] = snapshot_record(item)
+                if is_available(item):
+                    ids.add(item.id)
+            return ids
+
+        # id товаров в наличии в питере собираются в фоне
+        piter_ids_future = self.store_sessions.submit(piter_store, collect_piter_ids)
+
+        # Товары в мск читаем потоково, пока не наберем нужное число общих
+        common_products = []
+        for item in moscow_api.iter_catalog_items(
+            moscow_category,
+            stop=lambda _: len(common_products) >= self.PRODUCTS_LIMIT or cancelled(),
+            lean=True
+        ):
+            if moscow_records is not None:
+                moscow_records[item.id] = snapshot_record(item)
+            if is_available(item) and item.id in piter_ids_future.result():
+                common_products.append(to_product(item))
+        return common_products
+
+    def _plan_incremental(self, stores: dict, category_slug: str, moscow_category: int, piter_category: int,
+                          common_products: list, moscow_records: dict, piter_records: dict):
+        """Сравнивает прогон с прошлыми снимками: сохраняет в чекпоинт бренды, которые можно
+        переиспользовать, и дельту итогового списка; новые снимки пишутся черновиками"""
+        moscow_store, piter_store = stores["Москва"][0], stores["Санкт-Петербург"][0]
+        moscow_key = self.snapshots.store_key(moscow_store, moscow_category)
+        piter_key = self.snapshots.store_key(piter_store, piter_category)
+
+        # Москва читается не целиком, поэтому пропавшие товары там не определяются
+        moscow_delta = diff_snapshots(self.snapshots.load(moscow_key), moscow_records, complete=False)
+        piter_delta = diff_snapshots(self.snapshots.load(piter_key), piter_records)
+        changed = set(moscow_delta.added) | moscow_delta.changed_ids | set(piter_delta.added) | piter_delta.changed_ids
+
+        previous_view = self.snapshots.load(self.snapshots.view_key(moscow_store, piter_store, category_slug))
+        reused_brands = {
+            str(product["id"]): previous_view[product["id"]]["brand"]
+            for product in common_products
+            if product["id"] in previous_view and product["id"] not in changed and "brand" in previous_view[product["id"]]
         }
-        
-        # Получаем категории первого уровня в Питере
-        piter_stores = self.city_stores["Санкт-Петербург"]
-        piter_store, piter_store_location = random.choice(piter_stores)
+        view_delta = diff_snapshots(
+            previous_view, {product["id"]: product for product in common_products}, fields=("regular_price", "promo_price")
+        )
+        print(f"🔁 Изменения с прошлого прогона: новых {len(view_delta.added)}, пропало {len(view_delta.removed)}, "
+              f"изменилась цена {len(view_delta.changed)}; брендов без запросов: {len(reused_brands)}")
+
+        self.snapshots.save(moscow_key, moscow_records, pending=True)
+        self.snapshots.save(piter_key, piter_records, pending=True)
+        self.checkpoint.save(reused_brands=reused_brands, delta=view_delta.to_dict())
+
+    def _search_category(self, stores: dict, moscow_api: LentaAPI, moscow_categories: dict, piter_categories: dict) -> tuple:
+        """Первая категория, где набралось 100 общих товаров, и ее товары; (None, None), если такой нет.
+
+        Следующие категории проверяются заранее (`search_workers` одновременно), пока
+        проверяется текущая. Результаты разбираются по порядку, поэтому выбор категории
+        и чекпоинт такие же, как при проверке по одной; после первой подходящей
+        категории остальные проверки прерываются."""
+        piter_store = stores["Санкт-Петербург"][0]
+        # Поиск общих категорий (навсякий случай), уже проверенные при прошлом запуске пропускаются
+        checked_categories = self.checkpoint.get("checked_categories", [])
+        common_categories = set(moscow_categories.keys()) & set(piter_categories.keys())
+        candidates = list(common_categories - set(checked_categories))
+        if self.snapshots is not None:
+            # Категорию прошлого прогона проверяем первой
+            last_category = self.snapshots.load_meta().get("category")
+            candidates.sort(key=lambda slug: slug != last_category)
+
+        cancel = threading.Event()
+
+        def search(slug: str) -> tuple:
+            print(f"\n🔍 Поиск общих товаров в категории {slug}")
+            moscow_records = {} if self.snapshots is not None else None
+            piter_records = {} if self.snapshots is not None else None
+            products = self._find_common_products(
+                moscow_api, piter_store, moscow_categories[slug], piter_categories[slug],
+                moscow_records, piter_records, cancel
+            )
+            return products, moscow_records, piter_records
+
+        searches = ordered_prefetch(search, candidates, workers=self.search_workers,
+                                    profiler=self.profiler, name="search_category")
+        try:
+            for slug, (products, moscow_records, piter_records) in searches:
+                # Проверяем результаты
+                if len(products) < 100:
+                    print(f"❌ Нехватка общих товаров в категории {slug}")
+                    checked_categories.append(slug)
+                    self.checkpoint.save(checked_categories=checked_categories)
+                    continue
+
+                print(f"✅ Найдено {len(products)} общих товаров в категории {slug}")
+                # В чекпоинт идет копия: бренды, которые добавит обогащение, не должны попасть
+                # на диск раньше, чем товар записан в поток
+                self.checkpoint.save(category=slug, products=[dict(product) for product in products])
+                if self.snapshots is not None:
+                    self._plan_incremental(stores, slug, moscow_categories[slug], piter_categories[slug],
+                                           products, moscow_records, piter_records)
+                return slug, products
+        finally:
+            cancel.set()
+            searches.close()
+        return None, None
+
+    def run(self, resume: bool = False):
+        """Основная логика парсинга.
+
+        Каждый обогащенный товар сразу дописывается в поток, а выбранные магазины,
+        категория и готовые товары — в чекпоинт. С `resume=True` прогон продолжается
+        с места остановки: готовые товары не запрашиваются повторно."""
+        if resume and self.checkpoint.load():
+            self.stream.repair()
+            print(f"♻️ Продолжаем прогон: уже готово {len(self.stream.completed_ids())} товаров")
+        else:
+            self.checkpoint.clear()
+            self.stream.clear()
+            if self.snapshots is not None:
+                self.snapshots.discard_pending()
+
+        with self.profiler.stage("stores"):
+            stores = self._choose_stores()
+        moscow_store, moscow_store_location = stores["Москва"]
+        piter_store, piter_store_location = stores["Санкт-Петербург"]
+        print(f"📍 Москва, магазин ID: {moscow_store}, адрес: {moscow_store_location}")
         print(f"📍 Питер, магазин ID: {piter_store}, адрес: {piter_store_location}")
-        self.api.set_delivery(piter_store)
-        self.api.set_store(piter_store)
-        piter_categories_level_1 = {
-            x['slug']: x['id']
-            for x in self.api.get_categories()
-            if x['level'] == 1
-        }
 
-        # Поиск общих категорий (навсякий случай)
-        common_categories = set(moscow_categories_level_1.keys()) & set(piter_categories_level_1.keys())
-        for category_slug in common_categories:
-            print(f"\n🔍 Поиск общих товаров в категории {category_slug}")
-
-            # Получаем товары из категории в мск
-            self.api.set_delivery(moscow_store)
-            self.api.set_store(moscow_store)
-            moscow_items = self.api.get_catalog_items(moscow_categories_level_1[category_slug])
-            print("Делаем задержку на 5 секунд")
-            time.sleep(5)
-
-            # Получаем товары из категории в питере
-            self.api.set_delivery(piter_store)
-            self.api.set_store(piter_store)
-            piter_items = self.api.get_catalog_items(piter_categories_level_1[category_slug])
-            
-            # Сравниваем товары
-            if piter_items['total'] < 100 or moscow_items['total'] < 100:
-                print(f"❌ Нехватка товаров для сравнения в категории {category_slug}")
-                continue
-
-            # Находим общие товары по id
-            moscow_ids = {item["id"]: item for item in moscow_items['items'] if item["count"] > 0 and not item["features"]["isBlockedForSale"]}
-            piter_ids = {item["id"]: item for item in piter_items['items'] if item["count"] > 0 and not item["features"]["isBlockedForSale"]}
-            
-            for item in moscow_items['items']:
-                print(item.keys())
-
-
-            common_products = [
-                {
-                    "id": item["id"],
-                    "name": item["name"],
-                    "regular_price": item["prices"]["costRegular"] / 100,
-                    "promo_price": item["prices"]["cost"] / 100
-                }
-                for item_id, item in moscow_ids.items()
-                if item_id in piter_ids
-            ]
-            
-            common_products = common_products[:101] # 101 товаров
-
-            # Проверяем результаты
-            if len(common_products) < 100:
-                print(f"❌ Нехватка общих товаров в категории {category_slug}")
-                continue
-
-            print(f"✅ Найдено {len(common_products)} общих товаров в категории {category_slug}")
-            
-            # Добавялем бренды к товарам
-            for i, common_products_item in enumerate(common_products):
-                common_products_item["brand"] = self._get_brand_of_product(common_products_item["id"])
-                print(f"🛒 {common_products_item['name']} ({common_products_item['id']}) добавлен в список ({i+1}/{len(common_products)})")
-
-                # Длинная пауза после каждого батча
-                if (i + 1) % self.BATCH_SIZE == 0 and i < len(common_products) - 1:
-                    print(f"⏸️  Обработано {i+1} товаров, делаем паузу {self.BATCH_DELAY}с...")
-                    time.sleep(self.BATCH_DELAY)
-
-            return common_products
-        
-        print("❌ Не найдено общих категорий, где больше 100 общих товаров в наличии в Москве и Питере")
-        return []
+        # Магазины выбираются один раз, дальше у каждого своя сессия
+        with self.profiler.stage("categories"):
+            moscow_api = self.store_sessions.open([moscow_store, piter_store])[moscow_store]
+
+            # Получаем категории первого уровня в обоих городах параллельно
+            categories_level_1 = self.store_sessions.map(
+                lambda api: {x['slug']: x['id'] for x in api.get_categories() if x['level'] == 1},
+                [moscow_store, piter_store]
+            )
+        moscow_categories_level_1 = categories_level_1[moscow_store]
+        piter_categories_level_1 = categories_level_1[piter_store]
+
+        category_slug = self.checkpoint.get("category")
+        common_products = [dict(product) for product in self.checkpoint.get("products") or []]
+        if not category_slug:
+            with self.profiler.stage("search"):
+                category_slug, common_products = self._search_category(
+                    stores, moscow_api, moscow_categories_level_1, piter_categories_level_1
+                )
+            if not category_slug:
+                print("❌ Не найдено общих категорий, где больше 100 общих товаров в наличии в Москве и Питере")
+                return []
+
+        # Добавялем бренды к товарам, которые еще не готовы
+        completed = self.stream.completed_ids()
+        pending = [product for product in common_products if product["id"] not in completed]
+
+        # Не изменившиеся с прошлого прогона товары берут бренд из снимка
+        reused_brands = self.checkpoint.get("reused_brands") or {}
+        reused = set()
+        for product in pending:
+            if str(product["id"]) in reused_brands:
+                product["brand"] = reused_brands[str(product["id"])]
+                self._record_product(product)
+                reused.add(product["id"])
+        pending = [product for product in pending if product["id"] not in reused]
+
+        with self.profiler.stage("enrich"):
+            self._enrich_with_brands(pending, moscow_categories_level_1[category_slug], moscow_api,
+                                     on_product=self._record_product)
+        return self.stream.records(order=[product["id"] for product in common_products])
+
+    def finalize(self) -> list:
+        """Собирает итоговый JSON из потока и удаляет файлы прогона.
+        В инкрементальном режиме еще сохраняет дельту и делает снимки прогона текущими"""
+        with self.profiler.stage("finalize"):
+            return self._finalize()
+
+    def _finalize(self) -> list:
+        order = [product["id"] for product in self.checkpoint.get("products") or []] or None
+        data = self.stream.compact(self.RESULTS_FILE, order=order)
+        if self.snapshots is not None and self.checkpoint.get("category"):
+            stores = self.checkpoint.get("stores")
+            category_slug = self.checkpoint.get("category")
+            view_key = self.snapshots.view_key(stores["Москва"][0], stores["Санкт-Петербург"][0], category_slug)
+            self.snapshots.save(view_key, {product["id"]: product for product in data}, pending=True)
+            self.snapshots.commit_pending()
+            self.snapshots.save_meta(stores=stores, category=category_slug)
+            atomic_write_json(self.DELTA_FILE, self.checkpoint.get("delta") or {}, indent=4)
+            print(f"🔁 Изменения с прошлого прогона сохранены в {self.DELTA_FILE}")
+        self.checkpoint.clear()
+        self.stream.clear()
+        print(f"✅ Данные сохранены в {self.RESULTS_FILE}")
+        return data
 
     def save_results(self, data):
         """Сохраняет результаты в JSON"""
@@ -170,8 +412,59 @@ class LentaParser:
         print("✅ Данные сохранены в lenta_products_piter_moscow.json")
 
 if __name__ == "__main__":
-    api = LentaAPI()
-    parser = LentaParser(api)
-    
-    results = parser.run()  # Запускаем парсер
-    parser.save_results(results)  # Сохраняем в JSON
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Парсер товаров Ленты в Москве и Санкт-Петербурге")
+    arg_parser.add_argument("--resume", action="store_true", help="продолжить прерванный прогон по чекпоинту")
+    arg_parser.add_argument("--incremental", action="store_true",
+                            help="сравнить с прошлым прогоном и запрашивать бренды только для новых и изменившихся товаров")
+    arg_parser.add_argument("--brand-mode", choices=("items", "facets"), default="items",
+                            help="как определять бренды: по товарам или через фильтры категории")
+    arg_parser.add_argument("--cache", action="store_true",
+                            help="кэшировать категории, магазины и подробности товаров между прогонами")
+    arg_parser.add_argument("--record", metavar="CASSETTE", help="записать запросы и ответы в JSONL-кассету")
+    arg_parser.add_argument("--replay", metavar="CASSETTE", help="отвечать из кассеты, без сети")
+    arg_parser.add_argument("--api-url", help="адрес вместо api.lenta.com и lentochka.lenta.com (stub-сервер)")
+    arg_parser.add_argument("--metrics-port", type=int, help="отдавать счетчики запросов по HTTP на этом порту во время прогона")
+    arg_parser.add_argument("--metrics-file", default="lenta_metrics.json", help="куда сохранить счетчики запросов в конце прогона")
+    arg_parser.add_argument("--search-workers", type=int, default=2, help="сколько категорий проверять одновременно")
+    arg_parser.add_argument("--enrich-workers", type=int, default=4, help="сколько товаров обогащать одновременно запросами по товару")
+    arg_parser.add_argument("--log", action="store_true", help="писать подробный лог в консоль и lentaParser.log")
+    arg_parser.add_argument("--log-bodies", type=float, default=0.0, metavar="FRACTION",
+                            help="доля ответов, начало тела которых попадает в подробный лог")
+    args = arg_parser.parse_args()
+
+    if args.log:
+        setup_logging()
+
+    transport, rate_limiter = None, None
+    if args.replay:
+        # Без сети ограничивать скорость незачем
+        transport = ReplayTransport(args.replay)
+        rate_limiter = AdaptiveRateLimiter(initial_rate=1000, max_rate=1000)
+    elif args.record:
+        transport = RecordingTransport(args.record)
+
+    response_cache = ResponseCache(path="lenta_response_cache.json") if args.cache else None
+    api = LentaAPI(response_cache=response_cache, transport=transport, rate_limiter=rate_limiter,
+                   lentochka_url=args.api_url, api_url=args.api_url, log_bodies=args.log_bodies)
+    if args.metrics_port:
+        api.metrics.serve(args.metrics_port)
+        logger.info(f"📊 Счетчики запросов: http://127.0.0.1:{args.metrics_port}/metrics")
+    # При воспроизведении выбираются те же магазины, что и при записи
+    store_choice = prefer_stores(transport.cassette.selected_stores) if args.replay else random.choice
+    parser = LentaParser(api, brand_cache=BrandCache(), brand_mode=args.brand_mode, snapshots=SnapshotStore() if args.incremental else None,
+                         search_workers=args.search_workers, enrich_workers=args.enrich_workers,
+                         store_choice=store_choice)
+
+    parser.run(resume=args.resume)  # Запускаем парсер
+    parser.finalize()  # Собираем итоговый JSON из потока
+    logger.info(f"🔌 Статистика соединений: {api.transport.stats()}")
+    logger.info(f"🚦 Скорость запросов по хостам: {api.rate_limiter.stats()}")
+    logger.info(f"🆔 Личности клиента: {parser.identities.stats()}")
+    logger.info(f"⏱️ Время этапов: {parser.profiler.stats()}")
+    parser.identities.close()
+    parser.store_sessions.close()
+    api.metrics.dump(args.metrics_file)
+    logger.info(f"📊 Счетчики запросов сохранены в {args.metrics_file}")
+    if response_cache is not None:
+        response_cache.save()
+        logger.info(f"🗃️ Кэш ответов: {response_cache.stats()}")
\ No newline at end of file
@@ -0,0 +1,174 @@
+import re
+import json
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlsplit
+
+from checkpoint import atomic_write_json
+
+# Верхние границы корзин гистограммы задержек, в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint_name(url: str) -> str:
+    """Эндпоинт для меток: путь URL, в котором числовые id заменены на {id}"""
+    return _ID_SEGMENT.sub("/{id}", urlsplit(url).path) or "/"
+
+
+class _EndpointStats:
+    __slots__ = ("requests", "statuses", "throttled", "retries", "bytes_in", "bytes_out", "buckets", "latency_sum")
+
+    def __init__(self):
+        self.requests = 0
+        self.statuses: dict = {}
+        self.throttled = 0
+        self.retries = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # последняя — больше всех границ
+        self.latency_sum = 0.0
+
+
+class RequestMetrics:
+    """Счетчики запросов к API по эндпоинтам.
+
+    На каждый ответ — гистограмма задержки с фиксированными корзинами, байты
+    запроса и ответа, коды статусов и 429, на каждый повтор — счетчик повторов.
+    Запись — несколько сложений под блокировкой, поэтому счетчики можно держать
+    включенными всегда. Снимок доступен через `snapshot()`/`dump()`, а во время
+    прогона — по HTTP в формате Prometheus (`serve()`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: dict = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _stats(self, endpoint: str) -> _EndpointStats:
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = _EndpointStats()
+        return stats
+
+    def observe(self, url: str, status: int, seconds: float, bytes_out: int = 0, bytes_in: int = 0):
+        """Учитывает один выполненный запрос.
+
+        :param bytes_out: длина тела запроса в байтах
+        :param bytes_in: длина распакованного тела ответа в байтах (не размер на проводе)
+        """
+        bucket = bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            stats = self._stats(endpoint_name(url))
+            stats.requests += 1
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            if status == 429:
+                stats.throttled += 1
+            stats.bytes_in += bytes_in
+            stats.bytes_out += bytes_out
+            stats.buckets[bucket] += 1
+            stats.latency_sum += seconds
+
+    def record_retry(self, url: str):
+        with self._lock:
+            self._stats(endpoint_name(url)).retries += 1
+
+    @staticmethod
+    def _quantile(buckets: list, total: int, q: float) -> Optional[float]:
+        """Оценка квантиля по гистограмме (верхняя граница корзины)"""
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        """Счетчики по эндпоинтам"""
+        with self._lock:
+            endpoints = {}
+            for endpoint, stats in sorted(self._endpoints.items()):
+                endpoints[endpoint] = {
+                    "requests": stats.requests,
+                    "statuses": {str(status): count for status, count in sorted(stats.statuses.items())},
+                    "throttled": stats.throttled,
+                    "retries": stats.retries,
+                    "bytes_in": stats.bytes_in,
+                    "bytes_out": stats.bytes_out,
+                    "latency_avg": round(stats.latency_sum / stats.requests, 4) if stats.requests else None,
+                    "latency_p50": self._quantile(stats.buckets, stats.requests, 0.5),
+                    "latency_p95": self._quantile(stats.buckets, stats.requests, 0.95),
+                    "latency_buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], stats.buckets)),
+                }
+            return endpoints
+
+    def dump(self, path: str = "lenta_metrics.json"):
+        atomic_write_json(path, self.snapshot(), indent=4)
+
+    def to_prometheus(self) -> str:
+        """Счетчики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            for endpoint, stats in sorted(self._endpoints.items()):
+                label = f'endpoint="{endpoint}"'
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'lenta_requests_total{{{label},status="{status}"}} {count}')
+                lines.append(f"lenta_retries_total{{{label}}} {stats.retries}")
+                lines.append(f"lenta_throttled_total{{{label}}} {stats.throttled}")
+                lines.append(f"lenta_bytes_in_total{{{label}}} {stats.bytes_in}")
+                lines.append(f"lenta_bytes_out_total{{{label}}} {stats.bytes_out}")
+                cumulative = 0
+                for bound, count in zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], stats.buckets):
+                    cumulative += count
+                    lines.append(f'lenta_request_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f"lenta_request_seconds_sum{{{label}}} {stats.latency_sum:.6f}")
+                lines.append(f"lenta_request_seconds_count{{{label}}} {stats.requests}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9108, host: str = "127.0.0.1"):
+        """Отдает счетчики по HTTP (`/metrics` — Prometheus, `/metrics.json` — JSON) в фоновом потоке"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics.json":
+                    body, content_type = json.dumps(metrics.snapshot(), ensure_ascii=False), "application/json"
+                else:
+                    body, content_type = metrics.to_prometheus(), "text/plain; version=0.0.4"
+                payload = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+_default_metrics: Optional[RequestMetrics] = None
+_default_lock = threading.Lock()
+
+
+def get_default_metrics() -> RequestMetrics:
+    """Общие счетчики процесса (по умолчанию их используют все клиенты)"""
+    global _default_metrics
+    with _default_lock:
+        if _default_metrics is None:
+            _default_metrics = RequestMetrics()
+        return _default_metrics
@@ -0,0 +1,209 @@
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional
+
+from logger import get_logger
+logger = get_logger()
+
+# Обработчик профилировщика: (этап, секунды) после каждого выполнения этапа
+StageHook = Callable[[str, float], None]
+
+_DONE = object()
+
+
+class StageProfiler:
+    """Время этапов прогона.
+
+    Для каждого этапа копится число выполнений, время работы (для этапов
+    с несколькими потоками — сумма по потокам) и время ожидания в очередях
+    конвейера. `on_stage(name, seconds)`, если задан, вызывается после
+    каждого выполнения этапа — например, чтобы писать время в свои метрики.
+    """
+
+    def __init__(self, on_stage: Optional[StageHook] = None):
+        self.on_stage = on_stage
+        self._lock = threading.Lock()
+        self._stages: dict = {}
+
+    def _entry(self, name: str) -> dict:
+        return self._stages.setdefault(name, {"calls": 0, "seconds": 0.0, "wait_seconds": 0.0})
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            entry = self._entry(name)
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+        if self.on_stage is not None:
+            self.on_stage(name, seconds)
+
+    def record_wait(self, name: str, seconds: float):
+        with self._lock:
+            self._entry(name)["wait_seconds"] += seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def seconds(self, name: str) -> float:
+        with self._lock:
+            return self._stages.get(name, {}).get("seconds", 0.0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {"calls": entry["calls"], "seconds": round(entry["seconds"], 3),
+                       "wait_seconds": round(entry["wait_seconds"], 3)}
+                for name, entry in self._stages.items()
+            }
+
+
+class Pipeline:
+    """Конвейер из этапов-потоков, связанных ограниченными очередями.
+
+    Этап — функция `func(item)`, которая возвращает итерируемое с результатами
+    для следующего этапа (или None). Очереди между этапами ограничены `maxsize`,
+    поэтому быстрый этап ждет медленный, а не копит элементы в памяти.
+    Исключение в любом этапе останавливает конвейер и пробрасывается из `run`.
+    """
+
+    def __init__(self, profiler: Optional[StageProfiler] = None, maxsize: int = 32):
+        self.profiler = profiler or StageProfiler()
+        self.maxsize = maxsize
+        self._stages: list = []
+
+    def stage(self, name: str, func: Callable, workers: int = 1) -> "Pipeline":
+        self._stages.append((name, func, workers))
+        return self
+
+    def run(self, items: Iterable) -> Iterator:
+        """Пропускает `items` через этапы, выдает результаты последнего этапа (в порядке готовности)"""
+        stopped = threading.Event()
+        errors: list = []
+        queues = [queue.Queue(self.maxsize) for _ in range(len(self._stages) + 1)]
+
+        def put(q: queue.Queue, item, name: str) -> bool:
+            started = time.perf_counter()
+            while not stopped.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    self.profiler.record_wait(name, time.perf_counter() - started)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q: queue.Queue, name: str):
+            started = time.perf_counter()
+            while not stopped.is_set():
+                try:
+                    item = q.get(timeout=0.1)
+                    self.profiler.record_wait(name, time.perf_counter() - started)
+                    return item
+                except queue.Empty:
+                    continue
+            return _DONE
+
+        def feed():
+            try:
+                for item in items:
+                    if not put(queues[0], item, "source"):
+                        return
+            except Exception as e:
+                errors.append(e)
+                stopped.set()
+            put(queues[0], _DONE, "source")
+
+        def work(index: int, name: str, func: Callable, finished: list):
+            inbox, outbox = queues[index], queues[index + 1]
+            try:
+                while True:
+                    item = get(inbox, name)
+                    if item is _DONE:
+                        break
+                    with self.profiler.stage(name):
+                        results = func(item)
+                    for result in results or ():
+                        if not put(outbox, result, name):
+                            return
+            except Exception as e:
+                errors.append(e)
+                stopped.set()
+                return
+            finally:
+                # Конец входа видят все потоки этапа, следующему этапу он передается последним потоком
+                if not stopped.is_set():
+                    inbox.put(_DONE)
+                    with lock:
+                        finished[0] += 1
+                        last = finished[0] == workers_of[index]
+                    if last:
+                        put(outbox, _DONE, name)
+
+        lock = threading.Lock()
+        workers_of = [workers for _, _, workers in self._stages]
+        threads = [threading.Thread(target=feed, name="pipeline-source", daemon=True)]
+        for index, (name, func, workers) in enumerate(self._stages):
+            finished = [0]
+            threads += [threading.Thread(target=work, args=(index, name, func, finished), name=f"pipeline-{name}", daemon=True)
+                        for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = get(queues[-1], "sink")
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            stopped.set()
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+
+
+def ordered_prefetch(func: Callable, items: Iterable, workers: int = 2, lookahead: Optional[int] = None,
+                     profiler: Optional[StageProfiler] = None, name: str = "prefetch") -> Iterator:
+    """Выдает `(item, func(item))` в порядке `items`, заранее вычисляя следующие `lookahead` элементов
+    в `workers` потоках. Если перебор прервать, еще не начатые вычисления отменяются"""
+    lookahead = lookahead or workers
+    items = iter(items)
+    pending: deque = deque()
+
+    def timed(item):
+        started = time.perf_counter()
+        try:
+            return func(item)
+        finally:
+            if profiler is not None:
+                profiler.record(name, time.perf_counter() - started)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+    try:
+        for item in items:
+            pending.append((item, executor.submit(timed, item)))
+            if len(pending) >= lookahead:
+                break
+        while pending:
+            item, future = pending.popleft()
+            started = time.perf_counter()
+            result = future.result()
+            if profiler is not None:
+                profiler.record_wait(name, time.perf_counter() - started)
+            next_item = next(items, _DONE)
+            if next_item is not _DONE:
+                pending.append((next_item, executor.submit(timed, next_item)))
+            yield item, result
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -0,0 +1,211 @@
+import os
+import mmap
+import time
+import struct
+import argparse
+from bisect import bisect_right
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from catalog_item import CatalogItem
+
+# Запись истории: время, магазин, товар, цена, обычная цена, остаток (цены в копейках)
+RECORD = struct.Struct("<qqqiii")
+# Запись индекса прогона: товар, номер первой записи товара в прогоне, число записей
+INDEX_ENTRY = struct.Struct("<qII")
+# Запись о прогоне: время, первая запись и число записей, первая запись индекса и их число
+RUN = struct.Struct("<qqqqq")
+
+
+class PriceRecord(NamedTuple):
+    timestamp: int
+    store_id: int
+    product_id: int
+    price: int
+    cost_regular: int
+    count: int
+
+
+def rows_from_items(store_id, items: Iterable[CatalogItem]) -> Iterator[tuple]:
+    """Строки (магазин, товар, цена, обычная цена, остаток) из товаров `/v1/catalog/items`"""
+    for item in items:
+        yield int(store_id), item.id, item.price, item.cost_regular, 0 if item.is_blocked_for_sale else item.count
+
+
+class _MappedFile:
+    """Файл из записей фиксированной длины, открытый через mmap только на чтение"""
+
+    def __init__(self, path: str, record: struct.Struct):
+        self.record = record
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # Пустой файл нельзя отобразить в память
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self._map) // self.record.size
+
+    def __getitem__(self, index: int) -> tuple:
+        return self.record.unpack_from(self._map, index * self.record.size)
+
+    def slice(self, start: int, count: int) -> Iterator[tuple]:
+        return self.record.iter_unpack(self._map[start * self.record.size:(start + count) * self.record.size])
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+
+class _IndexKeys:
+    """id товаров одного прогона в индексе — последовательность для `bisect` без чтения всего индекса"""
+
+    def __init__(self, index: _MappedFile, start: int, count: int):
+        self.index, self.start, self.count = index, start, count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> int:
+        return self.index[self.start + i][0]
+
+
+class PriceHistory:
+    """История цен и остатков в компактных бинарных файлах только с дозаписью.
+
+    Каждый прогон дописывает в `records.bin` записи фиксированной длины,
+    отсортированные по товару, а в `index.bin` — по записи на товар с
+    положением его записей. Прогон считается записанным, только когда его
+    строка попала в `runs.bin`, поэтому оборванная запись не видна читателям
+    и обрезается при следующей дозаписи. Чтение идет через mmap: история
+    товара — бинарный поиск в индексе каждого прогона, цены на момент
+    времени — один непрерывный кусок файла, без разбора всего набора.
+    """
+
+    def __init__(self, root: str = "lenta_price_history"):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._records_path = os.path.join(root, "records.bin")
+        self._index_path = os.path.join(root, "index.bin")
+        self._runs_path = os.path.join(root, "runs.bin")
+        self._maps: Optional[tuple] = None
+
+    def _read_runs(self) -> list:
+        if not os.path.exists(self._runs_path):
+            return []
+        with open(self._runs_path, "rb") as f:
+            data = f.read()
+        # Недописанная строка прогона не считается
+        data = data[:len(data) - len(data) % RUN.size]
+        return list(RUN.iter_unpack(data))
+
+    def append_run(self, rows: Iterable[tuple], timestamp: Optional[int] = None) -> int:
+        """Дописывает прогон: строки (магазин, товар, цена, обычная цена, остаток).
+
+        Возвращает число записанных строк."""
+        timestamp = int(time.time() if timestamp is None else timestamp)
+        rows = sorted(rows, key=lambda row: (row[1], row[0]))
+        self.close()
+
+        runs = self._read_runs()
+        records_start, index_start = 0, 0
+        if runs:
+            _, first, count, index_first, index_count = runs[-1]
+            records_start, index_start = first + count, index_first + index_count
+
+        records = bytearray()
+        index = bytearray()
+        product_id, product_start = None, 0
+        for i, (store_id, row_product_id, price, cost_regular, count) in enumerate(rows):
+            if row_product_id != product_id:
+                if product_id is not None:
+                    index += INDEX_ENTRY.pack(product_id, product_start, i - product_start)
+                product_id, product_start = row_product_id, i
+            records += RECORD.pack(timestamp, store_id, row_product_id, price, cost_regular, count)
+        if product_id is not None:
+            index += INDEX_ENTRY.pack(product_id, product_start, len(rows) - product_start)
+
+        # Хвосты упавшей дозаписи отбрасываются, затем данные, индекс и, последней, строка прогона
+        for path, start, data in ((self._records_path, records_start * RECORD.size, records),
+                                  (self._index_path, index_start * INDEX_ENTRY.size, index)):
+            with open(path, "ab") as f:
+                f.truncate(start)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        with open(self._runs_path, "ab") as f:
+            f.truncate(len(runs) * RUN.size)
+            f.write(RUN.pack(timestamp, records_start, len(rows), index_start, len(index) // INDEX_ENTRY.size))
+            f.flush()
+            os.fsync(f.fileno())
+        return len(rows)
+
+    def _open(self) -> tuple:
+        if self._maps is None:
+            if not os.path.exists(self._runs_path):
+                return [], None, None
+            self._maps = (self._read_runs(), _MappedFile(self._records_path, RECORD), _MappedFile(self._index_path, INDEX_ENTRY))
+        return self._maps
+
+    def runs(self) -> list:
+        """Время всех записанных прогонов"""
+        return [run[0] for run in self._open()[0]]
+
+    def product_history(self, product_id: int, store_id: Optional[int] = None) -> list:
+        """Все записи товара по прогонам (по возрастанию времени)"""
+        runs, records, index = self._open()
+        history = []
+        for _, records_first, _, index_first, index_count in runs:
+            keys = _IndexKeys(index, index_first, index_count)
+            position = bisect_right(keys, product_id) - 1
+            if position < 0 or keys[position] != product_id:
+                continue
+            _, offset, count = index[index_first + position]
+            for record in records.slice(records_first + offset, count):
+                if store_id is None or record[1] == store_id:
+                    history.append(PriceRecord(*record))
+        return history
+
+    def prices_at(self, timestamp: int) -> list:
+        """Записи последнего прогона, сделанного не позже `timestamp`"""
+        runs, records, _ = self._open()
+        position = bisect_right([run[0] for run in runs], timestamp) - 1
+        if position < 0:
+            return []
+        _, first, count, _, _ = runs[position]
+        return [PriceRecord(*record) for record in records.slice(first, count)]
+
+    def close(self):
+        if self._maps is not None:
+            _, records, index = self._maps
+            records.close()
+            index.close()
+            self._maps = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="История цен Ленты")
+    arg_parser.add_argument("--root", default="lenta_price_history")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    product_command = commands.add_parser("product", help="история цен товара")
+    product_command.add_argument("product_id", type=int)
+    product_command.add_argument("--store", type=int, default=None)
+    at_command = commands.add_parser("at", help="цены на момент времени (unix timestamp)")
+    at_command.add_argument("timestamp", type=int)
+    args = arg_parser.parse_args()
+
+    with PriceHistory(args.root) as history:
+        if args.command == "product":
+            records = history.product_history(args.product_id, args.store)
+        else:
+            records = history.prices_at(args.timestamp)
+        for record in records:
+            print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(record.timestamp))} магазин {record.store_id} "
+                  f"товар {record.product_id}: {record.price / 100:.2f} (обычная {record.cost_regular / 100:.2f}), "
+                  f"остаток {record.count}")
+        print(f"📈 Записей: {len(records)}")
@@ -0,0 +1,253 @@
+import json
+import argparse
+from array import array
+from concurrent.futures import FIRST_COMPLETED, wait
+from statistics import median
+from typing import Iterable, Optional
+
+from LentaAPI import LentaAPI
+from catalog_item import CatalogItem
+from lenta import LentaParser
+from store_directory import StoreDirectory
+from store_sessions import StoreSessionPool
+from logger import get_logger
+logger = get_logger()
+
+MISSING = -1  # Товара нет в ассортименте магазина
+
+
+def _iter_bits(mask: int) -> list:
+    """Номера установленных битов маски по возрастанию"""
+    bits = bin(mask)[:1:-1]
+    return [i for i, bit in enumerate(bits) if bit == "1"]
+
+
+def _to_mask(flags: Iterable[bool]) -> int:
+    """Собирает битовую маску из последовательности флагов (первый флаг — младший бит)"""
+    bits = "".join("1" if flag else "0" for flag in flags)
+    return int(bits[::-1], 2) if bits else 0
+
+
+def _count_at_least(bitsets: Iterable[int], k: int, width: int) -> int:
+    """Маска позиций, где установлено не меньше `k` битов из `bitsets`.
+
+    Считает побитово-параллельно: счетчики всех позиций хранятся в «битовых
+    плоскостях», поэтому сложение одной маски — несколько операций над
+    длинными целыми, а не цикл по товарам."""
+    if k <= 0:
+        return (1 << width) - 1
+    planes: list = []
+    for carry in bitsets:
+        for i, plane in enumerate(planes):
+            planes[i] = plane ^ carry
+            carry &= plane
+            if not carry:
+                break
+        if carry:
+            planes.append(carry)
+
+    if k.bit_length() > len(planes):
+        return 0
+    greater, equal = 0, (1 << width) - 1
+    for i in range(len(planes) - 1, -1, -1):
+        if k >> i & 1:
+            equal &= planes[i]
+        else:
+            greater |= equal & planes[i]
+            equal &= ~planes[i]
+    return greater | equal
+
+
+class PriceMatrix:
+    """Колоночная матрица магазин × товар.
+
+    Цены, обычные цены и остатки лежат в плоских `array('i')` размера
+    `магазины × товары` (построчно по магазинам, `MISSING`, если товара нет).
+    Наличие по каждому магазину дополнительно хранится битовой маской, что
+    позволяет отвечать на запросы вида «в наличии хотя бы в k магазинах города»
+    побитовыми операциями."""
+
+    def __init__(self, store_ids: list, store_cities: dict, product_ids: list,
+                 price: array, cost_regular: array, count: array, names: Optional[dict] = None):
+        self.store_ids = store_ids
+        self.store_cities = store_cities
+        self.product_ids = product_ids
+        self.names = names or {}
+        self.price = price  # prices.cost, в копейках
+        self.cost_regular = cost_regular  # prices.costRegular, в копейках
+        self.count = count
+        self._store_index = {store_id: i for i, store_id in enumerate(store_ids)}
+        self._product_index = {product_id: i for i, product_id in enumerate(product_ids)}
+
+        width = len(product_ids)
+        self.available: list = []
+        for s in range(len(store_ids)):
+            row = count[s * width:(s + 1) * width]
+            self.available.append(_to_mask(value > 0 for value in row))
+
+    @property
+    def shape(self) -> tuple:
+        return len(self.store_ids), len(self.product_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Объем колонок в байтах"""
+        return sum(column.itemsize * len(column) for column in (self.price, self.cost_regular, self.count))
+
+    def _column(self, values: array, product_id) -> array:
+        """Значения всех магазинов для одного товара (срез с шагом — без цикла в Python)"""
+        return values[self._product_index[product_id]::len(self.product_ids)]
+
+    def get(self, store_id, product_id) -> Optional[dict]:
+        """Цена, обычная цена и остаток товара в магазине"""
+        offset = self._store_index[store_id] * len(self.product_ids) + self._product_index[product_id]
+        if self.price[offset] == MISSING:
+            return None
+        return {"price": self.price[offset], "cost_regular": self.cost_regular[offset], "count": self.count[offset]}
+
+    def stores_of_city(self, city) -> list:
+        return [store_id for store_id in self.store_ids if self.store_cities.get(store_id) == city]
+
+    def in_stock_mask(self, store_ids: Iterable, min_stores: int = 1) -> int:
+        """Маска товаров, которые в наличии хотя бы в `min_stores` из `store_ids`"""
+        bitsets = [self.available[self._store_index[store_id]] for store_id in store_ids]
+        return _count_at_least(bitsets, min_stores, len(self.product_ids))
+
+    def products_in_stock(self, min_stores_per_city: dict) -> list:
+        """id товаров, которые в наличии хотя бы в k магазинах каждого города: {город: k}"""
+        mask = (1 << len(self.product_ids)) - 1
+        for city, min_stores in min_stores_per_city.items():
+            mask &= self.in_stock_mask(self.stores_of_city(city), min_stores)
+        return [self.product_ids[p] for p in _iter_bits(mask)]
+
+    def price_stats(self, product_id, only_in_stock: bool = True) -> Optional[dict]:
+        """Минимальная, медианная и максимальная цена товара по магазинам (в рублях)"""
+        prices = self._column(self.price, product_id)
+        if only_in_stock:
+            counts = self._column(self.count, product_id)
+            values = sorted(price for price, count in zip(prices, counts) if count > 0)
+        else:
+            values = sorted(price for price in prices if price != MISSING)
+        if not values:
+            return None
+        return {
+            "min": values[0] / 100,
+            "median": median(values) / 100,
+            "max": values[-1] / 100,
+            "stores": len(values),
+        }
+
+    def price_stats_all(self, product_ids: Optional[Iterable] = None, only_in_stock: bool = True) -> dict:
+        """`price_stats` для набора товаров (по умолчанию — для всех)"""
+        product_ids = self.product_ids if product_ids is None else product_ids
+        stats = {}
+        for product_id in product_ids:
+            product_stats = self.price_stats(product_id, only_in_stock)
+            if product_stats is not None:
+                stats[product_id] = product_stats
+        return stats
+
+
+class PriceMatrixBuilder:
+    """Накопитель ответов `/v1/catalog/items` по магазинам для сборки `PriceMatrix`.
+
+    Пока магазины читаются, данные копятся в компактных тройках массивов
+    (магазин, товар, значение), а плотная матрица строится один раз в `build`."""
+
+    def __init__(self):
+        self.store_cities: dict = {}
+        self.names: dict = {}
+        self._store_ids: dict = {}
+        self._product_ids: dict = {}
+        self._store_idx = array("i")
+        self._product_idx = array("i")
+        self._price = array("i")
+        self._cost_regular = array("i")
+        self._count = array("i")
+
+    def add_items(self, store_id, items: Iterable[CatalogItem], city=None):
+        store_idx = self._store_ids.setdefault(store_id, len(self._store_ids))
+        if city is not None:
+            self.store_cities[store_id] = city
+        for item in items:
+            product_idx = self._product_ids.get(item.id)
+            if product_idx is None:
+                product_idx = self._product_ids[item.id] = len(self._product_ids)
+                self.names[item.id] = item.name
+            self._store_idx.append(store_idx)
+            self._product_idx.append(product_idx)
+            self._price.append(item.price)
+            self._cost_regular.append(item.cost_regular)
+            self._count.append(0 if item.is_blocked_for_sale else item.count)
+
+    def build(self) -> PriceMatrix:
+        width = len(self._product_ids)
+        size = len(self._store_ids) * width
+        price = array("i", [MISSING]) * size
+        cost_regular = array("i", [MISSING]) * size
+        count = array("i", [MISSING]) * size
+        for i in range(len(self._store_idx)):
+            offset = self._store_idx[i] * width + self._product_idx[i]
+            price[offset] = self._price[i]
+            cost_regular[offset] = self._cost_regular[i]
+            count[offset] = self._count[i]
+        return PriceMatrix(list(self._store_ids), self.store_cities, list(self._product_ids),
+                           price, cost_regular, count, self.names)
+
+
+class PriceMatrixEngine:
+    """Собирает `PriceMatrix` по категории сразу для всех переданных магазинов"""
+
+    def __init__(self, store_sessions: StoreSessionPool):
+        self.store_sessions = store_sessions
+
+    def collect(self, city_stores: dict, category_id: int) -> PriceMatrix:
+        """
+        Каталог магазина добавляется в матрицу, как только загружен, и сразу
+        освобождается, поэтому в памяти одновременно только каталоги загружаемых магазинов.
+
+        :param city_stores: {город: [id магазина, ...]}
+        :param category_id: категория каталога
+        """
+        store_city = {store_id: city for city, store_ids in city_stores.items() for store_id in store_ids}
+        builder = PriceMatrixBuilder()
+        pending = {
+            self.store_sessions.submit(store_id, lambda api: list(api.iter_catalog_items(category_id, lean=True))): store_id
+            for store_id in store_city
+        }
+        added = 0
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                store_id = pending.pop(future)
+                builder.add_items(store_id, future.result(), store_city[store_id])
+                added += 1
+                logger.info(f"🧮 Магазин {store_id} добавлен в матрицу ({added}/{len(store_city)})")
+            del done, future  # последние ссылки на загруженные товары
+        return builder.build()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Матрица цен и наличия по всем гипермаркетам городов")
+    arg_parser.add_argument("category_id", type=int)
+    arg_parser.add_argument("--min-stores", type=int, default=1, help="в скольких магазинах каждого города товар должен быть в наличии")
+    arg_parser.add_argument("--output", default="lenta_price_matrix.json")
+    args = arg_parser.parse_args()
+
+    api = LentaAPI()
+    city_stores = {
+        city: [store_id for store_id, _ in stores]
+        for city, stores in StoreDirectory().index(api).select(LentaParser.TARGET_CITIES).items()
+    }
+    with StoreSessionPool(transport=api.transport, rate_limiter=api.rate_limiter) as store_sessions:
+        matrix = PriceMatrixEngine(store_sessions).collect(city_stores, args.category_id)
+
+    print(f"🧮 Матрица {matrix.shape[0]} магазинов × {matrix.shape[1]} товаров, {matrix.nbytes / 1024:.0f} КБ")
+    product_ids = matrix.products_in_stock({city: args.min_stores for city in city_stores})
+    stats = matrix.price_stats_all(product_ids)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(
+            [{"id": product_id, "name": matrix.names[product_id], **stats[product_id]} for product_id in product_ids if product_id in stats],
+            f, ensure_ascii=False, indent=4
+        )
+    print(f"✅ {len(product_ids)} товаров в наличии минимум в {args.min_stores} магазинах каждого города сохранены в {args.output}")
@@ -0,0 +1,166 @@
+import time
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата) в секунды ожидания"""
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class _HostBucket:
+    """Токен-бакет одного хоста"""
+
+    __slots__ = ("rate", "tokens", "updated_at", "blocked_until", "requests", "throttled")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+
+
+class AdaptiveRateLimiter:
+    """Общий адаптивный ограничитель запросов (AIMD поверх токен-бакета).
+
+    Для каждого хоста держится свой бакет. Каждый успешный ответ увеличивает
+    допустимую скорость на `increase` запросов в секунду, а каждый 429 — делит
+    ее на `1 / decrease` и, если сервер прислал `Retry-After`, блокирует хост
+    на указанное время. Так скорость сама подстраивается под реальный лимит
+    сервера. Один экземпляр можно использовать одновременно из потоков
+    (`acquire`) и asyncio-задач (`acquire_async`).
+
+    Если запрос сделан от имени отдельного клиента (`client`, например DeviceId
+    личности), пауза по `Retry-After` ставится только этому клиенту, а общей
+    для хоста остается лишь сниженная скорость: остальные клиенты продолжают работу.
+    """
+
+    def __init__(self, initial_rate: float = 0.5, min_rate: float = 0.05, max_rate: float = 20.0,
+                 increase: float = 0.02, decrease: float = 0.5, burst: float = 1.0):
+        """
+        :param initial_rate: начальная скорость, запросов в секунду
+        :param min_rate: нижняя граница скорости
+        :param max_rate: верхняя граница скорости
+        :param increase: прибавка к скорости после каждого успешного ответа
+        :param decrease: множитель скорости после 429
+        :param burst: сколько запросов можно отправить подряд без ожидания
+        """
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self._buckets: dict = {}
+        self._client_blocks: dict = {}  # (хост, клиент) -> monotonic-время конца паузы
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlsplit(url).netloc or url
+
+    def _bucket(self, host: str) -> _HostBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = _HostBucket(self.initial_rate, self.burst)
+        return bucket
+
+    def _reserve(self, url: str, client=None) -> float:
+        """Резервирует токен и возвращает, сколько секунд нужно подождать до запроса"""
+        now = time.monotonic()
+        with self._lock:
+            host = self._host(url)
+            bucket = self._bucket(host)
+            blocked_until = bucket.blocked_until
+            if client is not None:
+                blocked_until = max(blocked_until, self._client_blocks.get((host, client), 0.0))
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * bucket.rate)
+            bucket.updated_at = now
+            bucket.tokens -= 1
+            bucket.requests += 1
+            wait = -bucket.tokens / bucket.rate if bucket.tokens < 0 else 0.0
+            return max(blocked_until - now, 0.0) + wait
+
+    def acquire(self, url: str, client=None):
+        """Блокирует поток, пока к хосту `url` нельзя отправить запрос (от имени `client`)"""
+        wait = self._reserve(url, client)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, url: str, client=None):
+        """Асинхронный вариант `acquire`"""
+        wait = self._reserve(url, client)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self, url: str):
+        """Аддитивно увеличивает скорость после успешного ответа"""
+        with self._lock:
+            bucket = self._bucket(self._host(url))
+            bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+
+    def on_throttle(self, url: str, retry_after: Optional[float] = None, client=None):
+        """Мультипликативно снижает скорость после 429 и ставит на паузу хост (или только `client`)"""
+        now = time.monotonic()
+        with self._lock:
+            host = self._host(url)
+            bucket = self._bucket(host)
+            bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+            bucket.throttled += 1
+            bucket.tokens = min(bucket.tokens, 0.0)
+            pause = retry_after if retry_after is not None else 1 / bucket.rate
+            if client is None:
+                bucket.blocked_until = max(bucket.blocked_until, now + pause)
+            else:
+                key = (host, client)
+                self._client_blocks[key] = max(self._client_blocks.get(key, 0.0), now + pause)
+                # Истекшие паузы других клиентов больше не нужны
+                for expired in [key for key, until in self._client_blocks.items() if until <= now]:
+                    del self._client_blocks[expired]
+
+    def feedback(self, url: str, status: int, headers=None, client=None):
+        """Учитывает ответ сервера: 429 замедляет, успешные ответы ускоряют"""
+        if status == 429:
+            self.on_throttle(url, parse_retry_after((headers or {}).get("Retry-After")), client)
+        elif status < 400:
+            self.on_success(url)
+
+    def current_rate(self, url: str) -> float:
+        """Текущая скорость для хоста `url`, запросов в секунду"""
+        with self._lock:
+            return self._bucket(self._host(url)).rate
+
+    def stats(self) -> dict:
+        """Скорость, число запросов и 429 по каждому хосту"""
+        with self._lock:
+            return {
+                host: {"rate": round(bucket.rate, 3), "requests": bucket.requests, "throttled": bucket.throttled}
+                for host, bucket in self._buckets.items()
+            }
+
+
+_default_rate_limiter: Optional[AdaptiveRateLimiter] = None
+_default_lock = threading.Lock()
+
+
+def get_default_rate_limiter() -> AdaptiveRateLimiter:
+    """Ограничитель, общий для всех клиентов процесса, если другой не передан явно"""
+    global _default_rate_limiter
+    with _default_lock:
+        if _default_rate_limiter is None:
+            _default_rate_limiter = AdaptiveRateLimiter()
+        return _default_rate_limiter
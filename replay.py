@@ -0,0 +1,222 @@
+import json
+import threading
+from typing import Optional
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from transport import HTTPTransport
+from logger import get_logger
+logger = get_logger()
+
+RECORDED_HEADERS = ("Content-Type", "Retry-After")
+STORE_SELECT_PATH = "/jrpc/pickupStoreSelectedSet"
+
+
+def _normalize_body(body) -> str:
+    """Тело запроса в виде строки; JSON приводится к каноничному виду (сортировка ключей)"""
+    if body is None:
+        return ""
+    if isinstance(body, bytes):
+        body = body.decode("utf-8")
+    try:
+        return json.dumps(json.loads(body), ensure_ascii=False, sort_keys=True)
+    except ValueError:
+        return body
+
+
+def request_key(method: str, url: str, body=None, store=None) -> tuple:
+    """Ключ запроса для поиска в кассете: метод, путь, отсортированный query, тело
+    и магазин, выбранный в сессии. Хост не учитывается, чтобы кассета подходила
+    и для stub-сервера"""
+    split = urlsplit(url)
+    return method.upper(), split.path, urlencode(sorted(parse_qsl(split.query))), _normalize_body(body), store
+
+
+def selected_store(url: str, body) -> Optional[int]:
+    """Магазин из запроса `pickupStoreSelectedSet` (None для остальных запросов)"""
+    if urlsplit(url).path != STORE_SELECT_PATH or not body:
+        return None
+    try:
+        return json.loads(body)["params"]["storeId"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class Cassette:
+    """JSONL-файл с парами запрос/ответ.
+
+    При воспроизведении ответ ищется сначала по точному ключу запроса, затем
+    только по методу, пути и магазину (в запросах есть случайные DeviceId и RequestId).
+    Если на один ключ записано несколько ответов, они выдаются по очереди.
+
+    Выбранный магазин хранится на сервере в сессии, поэтому кассета сама следит
+    за `pickupStoreSelectedSet` по SessionToken (как сервер) и добавляет магазин
+    к ключу: одинаковые запросы каталога двух магазинов не перепутаются, даже
+    если выполняются из разных потоков.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._exact: dict = {}
+        self._by_path: dict = {}
+        self._cursors: dict = {}
+        self._sessions: dict = {}  # SessionToken -> выбранный магазин
+        self.selected_stores: list = []  # магазины из записанных `pickupStoreSelectedSet`, по порядку
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+        except FileNotFoundError:
+            pass
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._exact.values())
+
+    def _index(self, entry: dict):
+        store = entry.get("store")
+        key = request_key(entry["method"], entry["url"], entry.get("body"), store)
+        self._exact.setdefault(key, []).append(entry)
+        self._by_path.setdefault((key[0], key[1], store), []).append(entry)
+        selected = selected_store(entry["url"], entry.get("body"))
+        if selected is not None and entry.get("status", 200) < 400 and selected not in self.selected_stores:
+            self.selected_stores.append(selected)
+
+    def _session_store(self, url: str, body, request_headers) -> Optional[int]:
+        """Магазин сессии запроса; запрос выбора магазина запоминает его для SessionToken"""
+        token = request_headers.get("SessionToken") if request_headers else None
+        selected = selected_store(url, body)
+        if selected is not None and token:
+            self._sessions[token] = selected
+        return self._sessions.get(token)
+
+    def record(self, method: str, url: str, body, status: int, response_body: str, headers: Optional[dict] = None,
+               request_headers: Optional[dict] = None):
+        entry = {
+            "method": method.upper(),
+            "url": url,
+            "body": _normalize_body(body),
+            "status": status,
+            "headers": {name: headers[name] for name in RECORDED_HEADERS if headers and name in headers},
+            "response": response_body,
+        }
+        with self._lock:
+            store = self._session_store(url, body, request_headers)
+            if store is not None and selected_store(url, body) is None:
+                entry["store"] = store
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._index(entry)
+
+    def _next(self, key, entries: list) -> dict:
+        position = self._cursors.get(key, 0)
+        self._cursors[key] = position + 1
+        return entries[min(position, len(entries) - 1)]
+
+    def match(self, method: str, url: str, body=None, request_headers: Optional[dict] = None) -> Optional[dict]:
+        """Записанный ответ на запрос или None"""
+        with self._lock:
+            store = self._session_store(url, body, request_headers)
+            if selected_store(url, body) is not None:
+                store = None
+            key = request_key(method, url, body, store)
+            path_key = (key[0], key[1], store)
+            if key in self._exact:
+                entry = self._next(key, self._exact[key])
+            elif path_key in self._by_path:
+                entry = self._next(path_key, self._by_path[path_key])
+            else:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry
+
+
+def _prepare(method: str, url: str, **kwargs) -> requests.PreparedRequest:
+    # Заголовки со значением None `requests.Session` молча отбрасывает, а `prepare()` на них падает
+    headers = {name: value for name, value in (kwargs.get("headers") or {}).items() if value is not None}
+    return requests.Request(method, url, params=kwargs.get("params"), data=kwargs.get("data"),
+                            json=kwargs.get("json"), headers=headers).prepare()
+
+
+class RecordingTransport:
+    """Транспорт, который выполняет запросы через `HTTPTransport` и пишет их в кассету"""
+
+    def __init__(self, cassette_path: str, transport: Optional[HTTPTransport] = None):
+        self.cassette = Cassette(cassette_path)
+        self.transport = transport or HTTPTransport()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        response = self.transport.request(method, url, **kwargs)
+        prepared = response.request if response.request is not None else _prepare(method, url, **kwargs)
+        self.cassette.record(method, prepared.url, prepared.body, response.status_code, response.text, response.headers,
+                             request_headers=kwargs.get("headers"))
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        return {**self.transport.stats(), "recorded": len(self.cassette)}
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ReplayTransport:
+    """Транспорт без сети: отвечает записями из кассеты (на неизвестный запрос — 404)"""
+
+    def __init__(self, cassette_path: str):
+        self.cassette = Cassette(cassette_path)
+        if not len(self.cassette):
+            raise ValueError(f"Кассета {cassette_path} пуста или не найдена")
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        prepared = _prepare(method, url, **kwargs)
+        entry = self.cassette.match(method, prepared.url, prepared.body, prepared.headers)
+        response = requests.Response()
+        response.url = prepared.url
+        response.request = prepared
+        response.encoding = "utf-8"
+        if entry is None:
+            logger.warning(f"⚠️ Нет записи в кассете для {method} {prepared.url}")
+            response.status_code = 404
+            response._content = json.dumps({"error": "нет записи в кассете"}).encode("utf-8")
+            response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+        else:
+            response.status_code = entry["status"]
+            response._content = entry["response"].encode("utf-8")
+            response.headers = CaseInsensitiveDict(entry.get("headers", {}))
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        return {"requests": self.cassette.hits + self.cassette.misses, "hits": self.cassette.hits, "misses": self.cassette.misses}
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
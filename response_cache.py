@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from checkpoint import atomic_write_json
+
+# Сколько секунд ответ считается свежим, по эндпоинтам
+DEFAULT_TTLS = {
+    "categories": 6 * 3600,
+    "stores": 24 * 3600,
+    "item": 3600,
+}
+
+
+class ResponseCache:
+    """Кэш ответов редко меняющихся эндпоинтов (категории, магазины, подробности товара).
+
+    Ключ — эндпоинт, контекст клиента (выбранные доставка и магазин) и параметры
+    запроса. У каждого эндпоинта свой TTL, при переполнении вытесняются давно не
+    использованные записи. Если задан `path`, кэш читается с диска при создании и
+    сохраняется `save()`, так что следующий прогон начинается с теплым кэшем.
+    """
+
+    def __init__(self, ttls: Optional[dict] = None, max_entries: int = 5000, path: Optional[str] = None):
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.path = path
+        self._entries: OrderedDict = OrderedDict()  # ключ -> (истекает, значение)
+        self._hits: dict = {}
+        self._misses: dict = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            self._load()
+
+    @staticmethod
+    def _key(endpoint: str, context, params) -> str:
+        return f"{endpoint}|{context}|{json.dumps(params, sort_keys=True)}"
+
+    def get(self, endpoint: str, context=None, params=None):
+        """Закэшированный ответ или None"""
+        key = self._key(endpoint, context, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._misses[endpoint] = self._misses.get(endpoint, 0) + 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits[endpoint] = self._hits.get(endpoint, 0) + 1
+            return entry[1]
+
+    def set(self, endpoint: str, value, context=None, params=None):
+        ttl = self.ttls.get(endpoint)
+        if not ttl or value is None:
+            return
+        key = self._key(endpoint, context, params)
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Попадания и промахи по эндпоинтам"""
+        with self._lock:
+            endpoints = set(self._hits) | set(self._misses)
+            stats = {}
+            for endpoint in sorted(endpoints):
+                hits, misses = self._hits.get(endpoint, 0), self._misses.get(endpoint, 0)
+                stats[endpoint] = {"hits": hits, "misses": misses, "hit_ratio": round(hits / (hits + misses), 3)}
+            return {"entries": len(self._entries), "endpoints": stats}
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            entries = json.load(f)
+        now = time.time()
+        for key, expires_at, value in entries:
+            if expires_at > now:
+                self._entries[key] = (expires_at, value)
+
+    def save(self):
+        """Сохраняет свежие записи на диск (если задан `path`)"""
+        if self.path is None:
+            return
+        now = time.time()
+        with self._lock:
+            entries = [[key, expires_at, value] for key, (expires_at, value) in self._entries.items() if expires_at > now]
+        atomic_write_json(self.path, entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
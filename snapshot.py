@@ -0,0 +1,119 @@
+import os
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from checkpoint import atomic_write_json
+from catalog_item import CatalogItem
+
+SNAPSHOT_FIELDS = ("price", "costRegular", "count", "isBlockedForSale")
+
+
+def snapshot_record(item: CatalogItem) -> dict:
+    """Поля товара из /v1/catalog/items, по которым сравниваются снимки"""
+    return {
+        "price": item.price,
+        "costRegular": item.cost_regular,
+        "count": item.count,
+        "isBlockedForSale": item.is_blocked_for_sale,
+    }
+
+
+@dataclass
+class SnapshotDelta:
+    """Разница между двумя снимками"""
+    added: list = field(default_factory=list)  # id новых товаров
+    removed: list = field(default_factory=list)  # id пропавших товаров
+    changed: list = field(default_factory=list)  # {"id", "old", "new"} для измененных товаров
+
+    @property
+    def changed_ids(self) -> set:
+        return {change["id"] for change in self.changed}
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.changed)
+
+    def to_dict(self) -> dict:
+        return {"added": self.added, "removed": self.removed, "changed": self.changed}
+
+
+def diff_snapshots(old: dict, new: dict, fields: Optional[Iterable[str]] = SNAPSHOT_FIELDS,
+                   complete: bool = True) -> SnapshotDelta:
+    """Сравнивает снимки {id: запись}.
+
+    :param fields: какие поля записи сравнивать (None — всю запись)
+    :param complete: `new` содержит все товары; если нет, пропавшие не определяются
+    """
+    fields = tuple(fields) if fields is not None else None
+    delta = SnapshotDelta()
+    for product_id, record in new.items():
+        previous = old.get(product_id)
+        if previous is None:
+            delta.added.append(product_id)
+            continue
+        if fields is None:
+            differs = previous != record
+        else:
+            differs = any(previous.get(name) != record.get(name) for name in fields)
+        if differs:
+            delta.changed.append({"id": product_id, "old": previous, "new": record})
+    if complete:
+        delta.removed = [product_id for product_id in old if product_id not in new]
+    return delta
+
+
+class SnapshotStore:
+    """Снимки предыдущего прогона на диске: по файлу JSON на ключ (магазин+категория, итоговый список и т.п.)"""
+
+    def __init__(self, root: str = "lenta_snapshots"):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def store_key(store_id, category_id) -> str:
+        return f"store_{store_id}_category_{category_id}"
+
+    @staticmethod
+    def view_key(moscow_store, piter_store, category_slug) -> str:
+        return f"view_{moscow_store}_{piter_store}_{category_slug}"
+
+    def _path(self, key: str, pending: bool = False) -> str:
+        return os.path.join(self.root, f"{key}.pending.json" if pending else f"{key}.json")
+
+    def load(self, key: str) -> dict:
+        """Записи снимка {id: запись} (пустой словарь, если снимка нет)"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return {int(product_id): record for product_id, record in data["records"].items()}
+
+    def save(self, key: str, records: dict, pending: bool = False):
+        """Сохраняет снимок. `pending=True` — черновик, который заменит текущий снимок
+        только после `commit_pending` (чтобы упавший прогон не испортил базу для сравнения)"""
+        atomic_write_json(self._path(key, pending), {"taken_at": time.time(), "records": records})
+
+    def commit_pending(self):
+        """Делает все черновики снимков текущими"""
+        for name in os.listdir(self.root):
+            if name.endswith(".pending.json"):
+                os.replace(os.path.join(self.root, name), os.path.join(self.root, name.replace(".pending.json", ".json")))
+
+    def discard_pending(self):
+        """Удаляет черновики снимков незавершенного прогона"""
+        for name in os.listdir(self.root):
+            if name.endswith(".pending.json"):
+                os.remove(os.path.join(self.root, name))
+
+    def load_meta(self) -> dict:
+        """Параметры последнего прогона (магазины, категория)"""
+        path = self._path("meta")
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_meta(self, **meta):
+        atomic_write_json(self._path("meta"), meta)
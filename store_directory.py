@@ -0,0 +1,179 @@
+import os
+import re
+import json
+import math
+import time
+import heapq
+from typing import Iterable, Optional
+
+from checkpoint import atomic_write_json
+from logger import get_logger
+logger = get_logger()
+
+# Город в адресе: «г. Химки», «г.Химки», «г Химки», «город Химки» или «Химки г»
+CITY_PATTERNS = (
+    re.compile(r"(?:^|,)\s*(?:г\.|город\s|г\s)\s*([^,]+)"),
+    re.compile(r"(?:^|,)\s*([^,]+?)\s+г\.?\s*(?:,|$)"),
+)
+COORDINATE_KEYS = (("lat", "long"), ("lat", "lng"), ("lat", "lon"), ("latitude", "longitude"))
+
+
+def normalize_city(city: str) -> str:
+    return city.strip().lower().replace("ё", "е")
+
+
+def store_city(store: dict) -> str:
+    """Город магазина: из `cityName`, иначе из адреса («..., г. Химки, ...» или первая часть адреса)"""
+    if store.get("cityName"):
+        return store["cityName"]
+    address = store.get("addressFull", "")
+    for pattern in CITY_PATTERNS:
+        match = pattern.search(address)
+        if match:
+            return match.group(1).strip()
+    return address.split(",", 1)[0]
+
+
+def store_coordinates(store: dict) -> Optional[tuple]:
+    """(широта, долгота) магазина или None, если координат в ответе нет"""
+    for lat_key, lon_key in COORDINATE_KEYS:
+        if store.get(lat_key) is not None and store.get(lon_key) is not None:
+            return float(store[lat_key]), float(store[lon_key])
+    return None
+
+
+def _to_unit_vector(lat: float, lon: float) -> tuple:
+    """Точка на единичной сфере: расстояние между такими точками монотонно расстоянию по поверхности Земли"""
+    lat, lon = math.radians(lat), math.radians(lon)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+class _KDTree:
+    """Трехмерное k-d дерево для поиска ближайших магазинов за O(log n) в среднем"""
+
+    def __init__(self, points: list):
+        # Узел: (точка, значение, ось, левое поддерево, правое поддерево)
+        self.root = self._build(points, 0)
+
+    def _build(self, points: list, depth: int):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda point: point[0][axis])
+        middle = len(points) // 2
+        return (points[middle][0], points[middle][1], axis,
+                self._build(points[:middle], depth + 1), self._build(points[middle + 1:], depth + 1))
+
+    def nearest(self, target: tuple, n: int, accept=None) -> list:
+        """`n` ближайших значений (с квадратом хордового расстояния), `accept(value)` — фильтр"""
+        best: list = []  # max-heap через отрицательные расстояния
+
+        def visit(node):
+            if node is None:
+                return
+            point, value, axis, left, right = node
+            distance = sum((a - b) ** 2 for a, b in zip(point, target))
+            if accept is None or accept(value):
+                if len(best) < n:
+                    heapq.heappush(best, (-distance, id(value), value))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, id(value), value))
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if len(best) < n or diff ** 2 < -best[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return [(value, -distance) for distance, _, value in sorted(best, reverse=True)]
+
+
+class StoreIndex:
+    """Индексы по списку магазинов: id, город + формат (`marketType`) и координаты"""
+
+    EARTH_RADIUS_KM = 6371.0
+
+    def __init__(self, stores: Iterable[dict]):
+        self.stores = list(stores)
+        self.by_id = {store["id"]: store for store in self.stores}
+        self.by_city: dict = {}  # нормализованный город -> {marketType: [магазины]}
+        points = []
+        for store in self.stores:
+            market_types = self.by_city.setdefault(normalize_city(store_city(store)), {})
+            market_types.setdefault(store.get("marketType"), []).append(store)
+            coordinates = store_coordinates(store)
+            if coordinates is not None:
+                points.append((_to_unit_vector(*coordinates), store))
+        self._tree = _KDTree(points)
+
+    def cities(self) -> list:
+        return list(self.by_city)
+
+    def in_city(self, city: str, market_type: Optional[str] = "HM") -> list:
+        """Магазины города (по умолчанию только гипермаркеты; `market_type=None` — все).
+
+        Если город по адресам не распознан, магазины ищутся по вхождению названия
+        города в `addressFull`, как раньше."""
+        market_types = self.by_city.get(normalize_city(city))
+        if market_types is None:
+            name = normalize_city(city)
+            return [store for store in self.stores
+                    if name in normalize_city(store.get("addressFull", ""))
+                    and (market_type is None or store.get("marketType") == market_type)]
+        if market_type is not None:
+            return list(market_types.get(market_type, []))
+        return [store for stores in market_types.values() for store in stores]
+
+    def select(self, cities: Iterable[str], market_type: Optional[str] = "HM") -> dict:
+        """{город: [(id, addressFull), ...]}"""
+        return {
+            city: [(store["id"], store["addressFull"]) for store in self.in_city(city, market_type)]
+            for city in cities
+        }
+
+    def nearest(self, lat: float, lon: float, n: int = 5, market_type: Optional[str] = None) -> list:
+        """`n` ближайших к точке магазинов: [(магазин, расстояние в км), ...]"""
+        accept = None if market_type is None else (lambda store: store.get("marketType") == market_type)
+        return [
+            (store, 2 * self.EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord2) / 2)))
+            for store, chord2 in self._tree.nearest(_to_unit_vector(lat, lon), n, accept)
+        ]
+
+
+class StoreDirectory:
+    """Справочник магазинов: ответ `/v1/stores/pickup/search` кэшируется на диске на `ttl` секунд,
+    а поиск по городу, формату и координатам идет по индексам `StoreIndex`"""
+
+    def __init__(self, path: str = "lenta_stores.json", ttl: float = 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._index: Optional[StoreIndex] = None
+
+    def load_cached(self) -> Optional[StoreIndex]:
+        """Индекс из кэша, если он есть и не устарел"""
+        if self._index is not None:
+            return self._index
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if time.time() - cached.get("fetched_at", 0) > self.ttl:
+            return None
+        self._index = StoreIndex(cached["stores"]["items"])
+        return self._index
+
+    def save(self, stores: dict) -> StoreIndex:
+        """Сохраняет свежий ответ `get_stores()` в кэш и возвращает индекс"""
+        atomic_write_json(self.path, {"fetched_at": time.time(), "stores": stores})
+        self._index = StoreIndex(stores["items"])
+        logger.info(f"🏬 Справочник магазинов обновлен: {len(self._index.stores)} магазинов")
+        return self._index
+
+    def index(self, api) -> StoreIndex:
+        """Индекс магазинов; `api.get_stores()` вызывается, только если кэш устарел"""
+        return self.load_cached() or self.save(api.get_stores())
+
+    def invalidate(self):
+        self._index = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
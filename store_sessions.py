@@ -0,0 +1,86 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Iterable, Optional, TypeVar
+
+from LentaAPI import LentaAPI
+from transport import HTTPTransport
+from ratelimit import AdaptiveRateLimiter, get_default_rate_limiter
+from response_cache import ResponseCache
+from logger import get_logger
+logger = get_logger()
+
+T = TypeVar("T")
+
+
+class StoreSessionPool:
+    """Пул клиентов, привязанных к магазинам.
+
+    Выбранный магазин хранится на стороне сервера в сессии клиента, поэтому
+    для каждого магазина заводится свой `LentaAPI` (свои DeviceId и SessionToken),
+    а `set_delivery` + `set_store` вызываются для него ровно один раз.
+    Все клиенты делят один HTTP-транспорт, а запросы к разным магазинам
+    можно выполнять параллельно через `submit`/`map`.
+    """
+
+    def __init__(self, transport: Optional[HTTPTransport] = None, max_workers: int = 4,
+                 api_factory: Callable[..., LentaAPI] = LentaAPI, rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 response_cache: Optional[ResponseCache] = None):
+        """
+        :param transport: общий транспорт для всех клиентов пула
+        :param rate_limiter: общий ограничитель скорости (по умолчанию — общий для процесса)
+        :param max_workers: сколько магазинов обрабатывать одновременно
+        :param response_cache: общий кэш ответов клиентов (None — без кэша)
+        :param api_factory: фабрика клиентов, принимает `transport=`, `rate_limiter=` и `response_cache=`
+        """
+        self.transport = transport or HTTPTransport(pool_maxsize=max_workers * 2)
+        self.api_factory = api_factory
+        self.rate_limiter = rate_limiter or get_default_rate_limiter()
+        self.response_cache = response_cache
+        self._sessions: dict = {}
+        self._store_locks: dict = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="store")
+
+    def _store_lock(self, store_id) -> threading.Lock:
+        with self._lock:
+            return self._store_locks.setdefault(store_id, threading.Lock())
+
+    def get(self, store_id) -> LentaAPI:
+        """Клиент с уже выбранным магазином `store_id` (создается при первом обращении)"""
+        api = self._sessions.get(store_id)
+        if api is not None:
+            return api
+
+        with self._store_lock(store_id):
+            api = self._sessions.get(store_id)
+            if api is None:
+                api = self.api_factory(transport=self.transport, rate_limiter=self.rate_limiter,
+                                       response_cache=self.response_cache)
+                api.set_delivery(store_id)
+                api.set_store(store_id)
+                self._sessions[store_id] = api
+                logger.info(f"🏪 Открыта сессия магазина {store_id} (DeviceId {api.device_id})")
+            return api
+
+    def open(self, store_ids: Iterable) -> dict:
+        """Параллельно открывает сессии для нескольких магазинов"""
+        store_ids = list(store_ids)
+        return dict(zip(store_ids, self._executor.map(self.get, store_ids)))
+
+    def submit(self, store_id, func: Callable[[LentaAPI], T]) -> "Future[T]":
+        """Выполняет `func(api)` в фоне на клиенте магазина `store_id`"""
+        return self._executor.submit(lambda: func(self.get(store_id)))
+
+    def map(self, func: Callable[[LentaAPI], T], store_ids: Iterable) -> dict:
+        """Выполняет `func(api)` для каждого магазина параллельно, возвращает {store_id: результат}"""
+        futures = {store_id: self.submit(store_id, func) for store_id in store_ids}
+        return {store_id: future.result() for store_id, future in futures.items()}
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,165 @@
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from LentaAPI import compute_qrator_token
+from replay import Cassette
+from logger import get_logger
+logger = get_logger()
+
+# Обработчик запроса: (метод, URL, заголовки, тело) -> (статус, тело ответа, заголовки) или None, если ответа нет
+Responder = Callable[[str, str, dict, bytes], Optional[tuple]]
+
+
+def cassette_responder(cassette: Cassette) -> Responder:
+    """Отвечает записями из кассеты"""
+    def respond(method: str, url: str, headers: dict, body: bytes):
+        entry = cassette.match(method, url, body, headers)
+        if entry is None:
+            return None
+        return entry["status"], entry["response"], entry.get("headers", {})
+    return respond
+
+
+class StubLentaServer:
+    """Локальный HTTP-сервер вместо api.lenta.com и lentochka.lenta.com.
+
+    Проверяет Qrator-Token так же, как клиент его считает (`compute_qrator_token`
+    от URL запроса и заголовка Timestamp), добавляет задержку и с вероятностью
+    `throttle_rate` отвечает 429 с `Retry-After`. Ответы дает `responder`
+    (например, `cassette_responder`). Клиент направляется на сервер через
+    `LentaAPI(lentochka_url=server.url, api_url=server.url)`.
+    """
+
+    def __init__(self, responder: Responder, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 1.0, validate_qrator: bool = True,
+                 seed: Optional[int] = None):
+        """
+        :param port: 0 — любой свободный порт
+        :param latency: задержка каждого ответа в секундах
+        :param throttle_rate: доля запросов, на которые отвечать 429
+        :param retry_after: значение `Retry-After` в ответах 429
+        :param validate_qrator: отвечать 403 на запросы с неверным Qrator-Token
+        """
+        self.responder = responder
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.validate_qrator = validate_qrator
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "throttled": 0, "rejected": 0, "missing": 0}
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _should_throttle(self) -> bool:
+        with self._lock:
+            return self.throttle_rate > 0 and self._random.random() < self.throttle_rate
+
+    def _qrator_ok(self, url: str, headers) -> bool:
+        token, timestamp = headers.get("Qrator-Token"), headers.get("Timestamp")
+        return bool(token and timestamp) and token == compute_qrator_token(url, timestamp)
+
+    def handle(self, method: str, url: str, headers, body: bytes) -> tuple:
+        """(статус, тело, заголовки) ответа на запрос"""
+        self._count("requests")
+        if self.latency:
+            time.sleep(self.latency)
+        if self.validate_qrator and not self._qrator_ok(url, headers):
+            self._count("rejected")
+            return 403, json.dumps({"error": "неверный Qrator-Token"}), {}
+        if self._should_throttle():
+            self._count("throttled")
+            return 429, "", {"Retry-After": str(self.retry_after)}
+        response = self.responder(method, url, headers, body)
+        if response is None:
+            self._count("missing")
+            return 404, json.dumps({"error": "нет ответа"}), {}
+        return response
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                url = f"http://{self.headers.get('Host')}{self.path}"
+                status, text, headers = server.handle(self.command, url, self.headers, body)
+                payload = text.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", headers.get("Content-Type", "application/json"))
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    if name != "Content-Type":
+                        self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def start(self) -> "StubLentaServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        logger.info(f"🧪 Stub-сервер Ленты запущен на {self.url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Локальный сервер Ленты, отвечающий записями из кассеты")
+    arg_parser.add_argument("cassette")
+    arg_parser.add_argument("--port", type=int, default=8080)
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--throttle-rate", type=float, default=0.0, help="доля запросов с ответом 429")
+    arg_parser.add_argument("--no-qrator", action="store_true", help="не проверять Qrator-Token")
+    args = arg_parser.parse_args()
+
+    server = StubLentaServer(cassette_responder(Cassette(args.cassette)), port=args.port, latency=args.latency,
+                             throttle_rate=args.throttle_rate, validate_qrator=not args.no_qrator)
+    print(f"🧪 Сервер слушает {server.url}, Ctrl+C для остановки")
+    try:
+        server.start()
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"🧪 Статистика сервера: {server.stats()}")
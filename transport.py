@@ -0,0 +1,116 @@
+import http.cookiejar
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class _ConnectionCounter:
+    """Потокобезопасный счетчик открытых TCP/TLS соединений"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def increment(self):
+        with self._lock:
+            self.opened += 1
+
+
+def _counting_pool(pool_cls, counter: _ConnectionCounter):
+    """Создает подкласс пула urllib3, который считает новые соединения"""
+
+    class CountingPool(pool_cls):
+        def _new_conn(self):
+            counter.increment()
+            return super()._new_conn()
+
+    CountingPool.__name__ = f"Counting{pool_cls.__name__}"
+    return CountingPool
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter, пулы которого сообщают о каждом новом соединении"""
+
+    def __init__(self, counter: _ConnectionCounter, **kwargs):
+        self._counter = counter
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self._counter),
+            "https": _counting_pool(HTTPSConnectionPool, self._counter),
+        }
+
+
+class HTTPTransport:
+    """HTTP-транспорт для LentaAPI с пулом keep-alive соединений.
+
+    Держит один `requests.Session` с пулом соединений на каждый хост
+    (api.lenta.com, lentochka.lenta.com), поэтому TCP+TLS рукопожатие
+    выполняется один раз, а не на каждый запрос.
+    """
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 10,
+                 connect_timeout: float = 5.0, read_timeout: float = 30.0):
+        """
+        :param pool_connections: количество хостов, для которых хранятся пулы
+        :param pool_maxsize: максимальное число соединений в пуле одного хоста
+        :param connect_timeout: таймаут установки соединения в секундах
+        :param read_timeout: таймаут чтения ответа в секундах
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self._counter = _ConnectionCounter()
+        self._lock = threading.Lock()
+        self._requests = 0
+
+        self.session = requests.Session()
+        # Сессию делят все клиенты (сессии магазинов, личности), а состояние у каждого
+        # свое в заголовках — поэтому cookies от сервера не сохраняются, иначе они
+        # склеили бы клиентов между собой
+        self.session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        adapter = _CountingHTTPAdapter(
+            self._counter,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Выполняет запрос через общий пул соединений"""
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self._requests += 1
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        """Счетчики переиспользования соединений"""
+        with self._lock:
+            total = self._requests
+        opened = self._counter.opened
+        reused = max(total - opened, 0)
+        return {
+            "requests": total,
+            "connections_opened": opened,
+            "connections_reused": reused,
+            "reuse_ratio": reused / total if total else 0.0,
+        }
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()